@@ -0,0 +1,120 @@
+"""Micro-batching of single-row model calls for the prediction API"""
+import asyncio
+import time
+
+import numpy as np
+
+from metrics import REGISTRY
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+class QueueFull(Exception):
+    """Raised when the batcher already holds max_queue rows"""
+
+
+class MicroBatcher:
+    """Queues feature rows and scores them together in one model call
+
+    A batch is flushed once it holds max_batch rows or max_wait seconds after its first
+    row arrived, whichever comes first. Each caller's future gets its own row back.
+    predict_fn(model, X) is a coroutine function; rows submitted for different models
+    (e.g. across a hot reload) are scored in separate calls. Up to max_concurrent
+    batches are scored at once, and while all are busy new rows fill the next batch.
+    """
+
+    def __init__(self, predict_fn, max_batch=32, max_wait=0.002, max_queue=1024, max_concurrent=1):
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.max_concurrent = max_concurrent
+        self._queue = None
+        self._task = None
+        self._slots = None
+        self._flushes = set()
+
+        self.batch_sizes = REGISTRY.histogram(
+            "agrigraud_batch_size", "Rows per batched model call", buckets=BATCH_SIZE_BUCKETS)
+        self.queue_wait = REGISTRY.histogram(
+            "agrigraud_batch_queue_wait_seconds", "Time a row waited in the batch queue")
+        self.rejected = REGISTRY.counter(
+            "agrigraud_batch_rejected_total", "Rows rejected because the batch queue was full")
+        REGISTRY.gauge("agrigraud_batch_queue_depth", "Rows waiting in the batch queue", fn=self.depth)
+        REGISTRY.gauge("agrigraud_batch_max_size", "Configured maximum batch size", fn=lambda: self.max_batch)
+        REGISTRY.gauge("agrigraud_batch_max_wait_seconds", "Configured batch wait window", fn=lambda: self.max_wait)
+        REGISTRY.gauge("agrigraud_batch_max_queue", "Configured batch queue depth", fn=lambda: self.max_queue)
+
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    async def submit(self, model, row):
+        """Probability row for one (n_features,) feature row, scored with model"""
+        if self._queue.qsize() >= self.max_queue:
+            self.rejected.inc()
+            raise QueueFull(f"Batch queue is full ({self.max_queue} rows)")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((model, row, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            flush = asyncio.create_task(self._flush(batch))
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch):
+        try:
+            await self._score(batch)
+        finally:
+            self._slots.release()
+
+    async def _score(self, batch):
+        now = time.perf_counter()
+        groups = {}
+        for model, row, future, queued in batch:
+            self.queue_wait.observe(now - queued)
+            groups.setdefault(id(model), (model, []))[1].append((row, future))
+
+        for model, items in groups.values():
+            self.batch_sizes.observe(len(items))
+            try:
+                probs = await self.predict_fn(model, np.stack([row for row, _ in items]))
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), row_probs in zip(items, probs):
+                if not future.done():
+                    future.set_result(row_probs)
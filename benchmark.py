@@ -0,0 +1,255 @@
+"""Load and latency benchmarks for the prediction API and the model
+
+    python benchmark.py                     # load mixes + model microbenchmarks
+    python benchmark.py --model-only
+    python benchmark.py compare old.json new.json
+
+Load runs start openmeteo_stub.py and main.py (uvicorn) as subprocesses, with a fresh
+response cache and weather store, and drive each scenario at each concurrency level
+for a fixed duration. Warm scenarios reuse a set of locations fetched beforehand, cold
+ones ask for a new grid cell every time. Latencies are measured client side; the
+stage breakdown comes from the Server-Timing header. Results go to a JSON file that
+records the git commit and the configuration, so runs can be compared.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import httpx
+import numpy as np
+
+from registry import load_model
+from timing import git_commit, percentiles, time_batches
+
+SCENARIOS = {
+    # name: (path, share of cold locations, rows per request)
+    "warm_single": ("/predict", 0.0, 1),
+    "cold_single": ("/predict", 1.0, 1),
+    "mixed_single": ("/predict", 0.2, 1),
+    "warm_batch": ("/predict/batch", 0.0, 100),
+    "mixed_batch": ("/predict/batch", 0.2, 100),
+}
+MODEL_BATCH_SIZES = [1, 8, 32, 128, 512, 1024]
+
+
+def parse_server_timing(header):
+    stages = {}
+    for part in header.split(","):
+        name, _, duration = part.strip().partition(";dur=")
+        if duration:
+            stages[name] = float(duration) / 1000
+    return stages
+
+
+class Workload:
+    """Reproducible request bodies: warm rows from a fixed set of locations, cold ones from fresh grid cells"""
+
+    def __init__(self, soil_types, water_sources, seed=0, warm_locations=50):
+        # Classes of the served model's encoder, so every request is valid and the numbers are not 400s
+        self.soil_types = list(soil_types)
+        self.water_sources = list(water_sources)
+        self.rng = random.Random(seed)
+        self.warm = [(round(self.rng.uniform(10, 28), 3), round(self.rng.uniform(72, 86), 3))
+                     for _ in range(warm_locations)]
+        self._cold = 0
+
+    def cold_location(self):
+        # Walk a 0.1 degree lattice south of the warm area, one new cell per call
+        self._cold += 1
+        return round(-10 - 0.1 * (self._cold // 300), 2), round(60 + 0.1 * (self._cold % 300), 2)
+
+    def row(self, cold_share):
+        lat, lng = self.cold_location() if self.rng.random() < cold_share else self.rng.choice(self.warm)
+        return {
+            "n": self.rng.randint(0, 140), "p": self.rng.randint(5, 145), "k": self.rng.randint(5, 205),
+            "ph": round(self.rng.uniform(4.5, 8.5), 1), "soil_type": self.rng.choice(self.soil_types),
+            "water_sources": self.rng.sample(self.water_sources, self.rng.randint(1, len(self.water_sources))),
+            "lat": lat, "lng": lng,
+        }
+
+
+async def run_scenario(client, workload, name, concurrency, duration):
+    path, cold_share, rows = SCENARIOS[name]
+    latencies, stages, statuses = [], {}, {}
+    stop = time.perf_counter() + duration
+
+    async def user():
+        while time.perf_counter() < stop:
+            if rows == 1:
+                body = workload.row(cold_share)
+            else:
+                body = [workload.row(cold_share) for _ in range(rows)]
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                response, status = None, type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if response is not None and "server-timing" in response.headers:
+                for stage, seconds in parse_server_timing(response.headers["server-timing"]).items():
+                    stages.setdefault(stage, []).append(seconds)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": name, "path": path, "concurrency": concurrency, "cold_share": cold_share,
+        "rows_per_request": rows, "requests": len(latencies), "statuses": statuses,
+        "rps": len(latencies) / elapsed, "rows_per_second": len(latencies) * rows / elapsed,
+        "latency": percentiles(latencies),
+        "stages": {stage: percentiles(values) for stage, values in stages.items()},
+    }
+
+
+def _wait_until_up(url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def load_benchmarks(args):
+    workdir = tempfile.mkdtemp(prefix="agrigraud-bench-")
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    api_url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ,
+               AGRIGRAUD_OPENMETEO_URL=f"{stub_url}/v1",
+               AGRIGRAUD_RESPONSE_CACHE=os.path.join(workdir, "weather_cache.sqlite"),
+               AGRIGRAUD_WEATHER_STORE=os.path.join(workdir, "weather_store"),
+               AGRIGRAUD_PREFETCH_INTERVAL="0",
+               AGRIGRAUD_TIMING_HEADER="1")
+    env.update(item.split("=", 1) for item in args.env)
+
+    stub = subprocess.Popen([sys.executable, "openmeteo_stub.py", "--port", str(args.stub_port),
+                             "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+                             "--error-rate", str(args.error_rate)])
+    api = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+                            "--log-level", "warning"], env=env)
+    results = []
+    try:
+        _wait_until_up(f"{stub_url}/health", stub)
+        _wait_until_up(f"{api_url}/health", api)
+        encoder = load_model().encoder
+        workload = Workload(encoder.soil_classes, encoder.water_sources, args.seed)
+        limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+        async with httpx.AsyncClient(base_url=api_url, timeout=60, limits=limits) as client:
+            # Fetch the warm locations once so warm scenarios only see cache hits
+            await client.post("/predict/batch", json=[dict(workload.row(0.0), lat=lat, lng=lng)
+                                                      for lat, lng in workload.warm])
+            for name in args.scenarios:
+                for concurrency in args.concurrency:
+                    result = await run_scenario(client, workload, name, concurrency, args.duration)
+                    latency = result["latency"]
+                    print(f"{name:<14} c={concurrency:<4} {result['rps']:9.1f} req/s  "
+                          f"p50 {latency['p50_ms']:8.2f}  p95 {latency['p95_ms']:8.2f}  "
+                          f"p99 {latency['p99_ms']:8.2f} ms  {result['statuses']}")
+                    results.append(result)
+        upstream = httpx.get(f"{stub_url}/calls").json()
+    finally:
+        api.terminate()
+        stub.terminate()
+        api.wait()
+        stub.wait()
+    return results, upstream
+
+
+def model_benchmarks(engines, batch_sizes, min_time=0.5, seed=0):
+    """predict_proba latency per call and rows/s across batch sizes, for each engine"""
+    rng = np.random.default_rng(seed)
+    results = []
+    # sklearn warns on every call that the matrix has no column names
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    for engine in engines:
+        bundle = load_model(engine=engine)
+        encoder = bundle.encoder
+        n = max(batch_sizes)
+        X = encoder.encode_many(
+            np.column_stack([rng.integers(0, 140, n), rng.integers(5, 145, n), rng.integers(5, 205, n),
+                             rng.uniform(4.5, 8.5, n)]),
+            rng.choice(encoder.soil_classes, n),
+            [{key: float(rng.uniform(0, 100)) for key in ("past_temp", "future_temp", "past_rain", "hum")}
+             | {"future_prob": float(rng.uniform(0, 1)), "sm1": 0.2, "sm2": 0.3, "sm3": 0.3} for _ in range(n)],
+            [list(rng.choice(encoder.water_sources, rng.integers(1, 3), replace=False)) for _ in range(n)],
+        )
+        for timing in time_batches(bundle, X, batch_sizes, min_time):
+            result = {"engine": engine, "model_version": bundle.version, **timing}
+            print(f"{engine:<8} batch {timing['batch_size']:<5} p50 {timing['latency']['p50_ms']:9.3f} ms  "
+                  f"{timing['rows_per_second']:12.0f} rows/s")
+            results.append(result)
+    return results
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['meta']['commit']} -> {new['meta']['commit']}")
+
+    old_load = {(r["scenario"], r["concurrency"]): r for r in old.get("load", [])}
+    for r in new.get("load", []):
+        before = old_load.get((r["scenario"], r["concurrency"]))
+        if before:
+            print(f"{r['scenario']:<14} c={r['concurrency']:<4} rps {before['rps']:9.1f} -> {r['rps']:9.1f}  "
+                  f"p99 {before['latency']['p99_ms']:8.2f} -> {r['latency']['p99_ms']:8.2f} ms")
+    old_model = {(r["engine"], r["batch_size"]): r for r in old.get("model", [])}
+    for r in new.get("model", []):
+        before = old_model.get((r["engine"], r["batch_size"]))
+        if before:
+            print(f"{r['engine']:<8} batch {r['batch_size']:<5} p50 {before['latency']['p50_ms']:9.3f} -> "
+                  f"{r['latency']['p50_ms']:9.3f} ms")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["compare"]:
+        compare(*sys.argv[2:4])
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description="Benchmark the prediction API and model")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario and concurrency level")
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="Stub upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Stub upstream latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Stub upstream 502 rate")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--stub-port", type=int, default=8011)
+    parser.add_argument("--env", nargs="*", default=[], metavar="KEY=VALUE", help="Extra API environment")
+    parser.add_argument("--engines", nargs="+", default=["flat", "sklearn"])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=MODEL_BATCH_SIZES)
+    parser.add_argument("--model-only", action="store_true")
+    parser.add_argument("--skip-model", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="JSON results path (default bench_results/<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    report = {"meta": {"commit": git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                       "python": platform.python_version(), "cpus": os.cpu_count(),
+                       "config": {k: v for k, v in vars(args).items() if k != "out"}}}
+    if not args.model_only:
+        report["load"], report["upstream"] = asyncio.run(load_benchmarks(args))
+    if not args.skip_model:
+        report["model"] = model_benchmarks(args.engines, args.batch_sizes)
+
+    out = args.out or f"bench_results/{report['meta']['commit'] or 'local'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out}")
@@ -0,0 +1,168 @@
+"""Versioned, memory-mappable model bundle
+
+A bundle is a directory:
+    manifest.json   format, version, feature order, class list, encoder vocabularies,
+                    forest shape and a sha256 per array file plus an overall checksum
+    *.npy           the FlatForest node table, memory-mapped read-only on load so
+                    every worker process shares the same physical pages
+    model.joblib    the sklearn estimator, only unpickled for engine="sklearn"
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import joblib
+import numpy as np
+
+from features import FeatureEncoder
+from forest import FlatForest, compile_forest
+
+BUNDLE_DIR = "model_bundle"
+BUNDLE_FORMAT = 1
+FOREST_ARRAYS = ["feature", "threshold", "children", "value", "roots"]
+PICKLES = ["crop_model.pkl", "soil_encoder.pkl", "label_encoder.pkl", "water_source_mlb.pkl"]
+
+
+class ModelBundle:
+    """A loaded model: scoring engine, feature encoder and its manifest"""
+
+    def __init__(self, model, encoder, manifest, path=None):
+        self.model = model
+        self.encoder = encoder
+        self.manifest = manifest
+        self.path = path
+        self.version = manifest.get("version", "unversioned")
+
+    def predict_proba(self, X):
+        return self.model.predict_proba(X)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_bundle(path, model, soil_le, mlb, label_le, version=None, include_sklearn=True, compact=False,
+                 lineage=None):
+    """Compiles and verifies the forest, then writes a bundle directory at path
+
+    compact=True stores the float32 forest (FlatForest.compact) for the flat engine.
+    lineage is recorded as is, e.g. the parent version of an incremental update.
+    """
+    flat = compile_forest(model, compact=compact)
+    tmp = f"{path}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    arrays = {}
+    for name in FOREST_ARRAYS:
+        array = np.ascontiguousarray(getattr(flat, name))
+        np.save(f"{tmp}/{name}.npy", array)
+        arrays[name] = {"file": f"{name}.npy", "dtype": str(array.dtype), "shape": list(array.shape),
+                        "sha256": _sha256(f"{tmp}/{name}.npy")}
+    if include_sklearn:
+        joblib.dump(model, f"{tmp}/model.joblib")
+
+    checksum = hashlib.sha256("".join(arrays[name]["sha256"] for name in FOREST_ARRAYS).encode()).hexdigest()
+    n_features = model.n_features_in_
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": version or f"{time.strftime('%Y%m%d-%H%M%S')}-{checksum[:8]}",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "feature_order": [str(c) for c in getattr(model, "feature_names_in_", range(n_features))],
+        "classes": [str(c) for c in label_le.classes_],
+        "soil_classes": [str(c) for c in soil_le.classes_],
+        "water_sources": [str(c) for c in mlb.classes_],
+        "n_trees": flat.n_trees,
+        "max_depth": flat.max_depth,
+        "compact": compact,
+        "model_classes": [int(c) for c in flat.classes_],
+        "arrays": arrays,
+        "checksum": checksum,
+        "sklearn_model": "model.joblib" if include_sklearn else None,
+        "lineage": lineage,
+    }
+    with open(f"{tmp}/manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return manifest
+
+
+def read_manifest(path=BUNDLE_DIR):
+    with open(f"{path}/manifest.json") as f:
+        return json.load(f)
+
+
+def load_bundle(path=BUNDLE_DIR, engine="flat", mmap=True, verify_checksum=False):
+    """Maps a bundle's forest arrays (or unpickles its sklearn model) and builds the encoder"""
+    manifest = read_manifest(path)
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"Unsupported bundle format {manifest.get('format')} in {path}")
+    if verify_checksum:
+        for name, info in manifest["arrays"].items():
+            if _sha256(f"{path}/{info['file']}") != info["sha256"]:
+                raise ValueError(f"Checksum mismatch for {name} in {path}")
+
+    if engine == "flat":
+        arrays = {name: np.load(f"{path}/{info['file']}", mmap_mode="r" if mmap else None)
+                  for name, info in manifest["arrays"].items()}
+        model = FlatForest(max_depth=manifest["max_depth"], classes=manifest["model_classes"], **arrays)
+    elif engine == "sklearn":
+        if not manifest.get("sklearn_model"):
+            raise ValueError(f"Bundle {path} was written without the sklearn model")
+        model = joblib.load(f"{path}/{manifest['sklearn_model']}")
+    else:
+        raise ValueError(f"Unknown inference engine: {engine}")
+
+    encoder = FeatureEncoder(manifest["soil_classes"], manifest["water_sources"], manifest["classes"])
+    return ModelBundle(model, encoder, manifest, path)
+
+
+def benchmark(directory=".", bundle_path=None, repeat=5):
+    """Cold-start comparison: unpickling the four files vs mapping the bundle"""
+    def best_of(fn):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+        return min(times) * 1000, result
+
+    results = {}
+    if all(os.path.exists(f"{directory}/{name}") for name in PICKLES):
+        results["pickles"], _ = best_of(lambda: [joblib.load(f"{directory}/{name}") for name in PICKLES])
+    bundle_path = bundle_path or f"{directory}/{BUNDLE_DIR}"
+    results["bundle_mmap"], loaded = best_of(lambda: load_bundle(bundle_path))
+    results["bundle_mmap_checksum"], _ = best_of(lambda: load_bundle(bundle_path, verify_checksum=True))
+    results["bundle_in_memory"], _ = best_of(lambda: load_bundle(bundle_path, mmap=False))
+    results["bundle_sklearn"], _ = best_of(lambda: load_bundle(bundle_path, engine="sklearn"))
+
+    # First prediction after mapping pays for paging the node table in
+    row = np.zeros((1, loaded.encoder.n_features))
+    results["first_predict_after_mmap"], _ = best_of(lambda: load_bundle(bundle_path).predict_proba(row))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Model bundle tools")
+    parser.add_argument("--benchmark", action="store_true", help="Compare pickle and bundle load times")
+    parser.add_argument("--dir", default=".", help="Directory holding the pickles")
+    parser.add_argument("--bundle", default=BUNDLE_DIR, help="Bundle directory, e.g. models/<version>")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(f"{'LOAD PATH':<28} | BEST OF 5 (ms)")
+        print("-" * 45)
+        for name, ms in benchmark(args.dir, args.bundle).items():
+            print(f"{name:<28} | {ms:10.2f}")
+    else:
+        manifest = read_manifest(args.bundle)
+        print(json.dumps({k: v for k, v in manifest.items() if k != "arrays"}, indent=2))
@@ -0,0 +1,159 @@
+"""In-process caches shared by the prediction API"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class TTLCache:
+    """Size-bounded LRU mapping whose entries also expire ttl seconds after being set
+
+    Not thread-safe: the API only touches it from the event loop.
+    """
+
+    def __init__(self, max_size=10000, ttl=3600, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()  # key -> (expires, value), oldest use first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= self._clock():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        self._data[key] = (self._clock() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def ttl_left(self, key):
+        """Seconds until key expires, None when it is not cached; does not count as a use"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        return max(entry[0] - self._clock(), 0.0)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > self._clock()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data), "max_size": self.max_size,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ResultCache:
+    """LRU cache of probability rows keyed on the model version and a quantized feature row
+
+    Feature values are rounded to decimals places, so requests that differ only by float
+    noise share an entry. Entries of a previous model version are dropped on the first
+    lookup once the served version (current) changes; lookups and writes for any other
+    version, such as requests still finishing on the old model, miss and are ignored,
+    so the cache never switches back. Each entry remembers what scoring it cost, and a hit adds that
+    to saved_seconds.
+    """
+
+    def __init__(self, max_size=10000, decimals=2):
+        self.decimals = decimals
+        self.version = None
+        self.entries = TTLCache(max_size, ttl=math.inf)
+        self.saved_seconds = 0.0
+        self.invalidations = 0
+
+    def key(self, row):
+        return np.round(np.asarray(row, dtype=np.float64), self.decimals).astype(np.float32).tobytes()
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self.version is not None:
+                self.entries.clear()
+                self.invalidations += 1
+            self.version = version
+
+    def get(self, version, row, current=None):
+        """Cached probabilities of row for version; current is the version being served, default version"""
+        self._check_version(current or version)
+        if version != self.version:
+            return None
+        entry = self.entries.get(self.key(row))
+        if entry is None:
+            return None
+        probs, cost = entry
+        self.saved_seconds += cost
+        return probs
+
+    def set(self, version, row, probs, cost):
+        # A request still finishing on the previous model must not repopulate the cache
+        if version == self.version:
+            # A copy: probs is usually a row view that would keep the whole batch's output alive
+            self.entries.set(self.key(row), (np.array(probs, copy=True), cost))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        return dict(self.entries.stats(), version=self.version, saved_seconds=self.saved_seconds,
+                    invalidations=self.invalidations)
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one in-flight task
+
+    Every waiter gets the task's result or its exception. The task is shielded, so a
+    caller that gives up does not cancel the work the others are waiting on.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def running(self, key):
+        return key in self._inflight
+
+    def _finish(self, key, task):
+        self._inflight.pop(key, None)
+        # Mark the exception retrieved even if every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self):
+        return len(self._inflight)
+
+    def stats(self):
+        return {"in_flight": len(self._inflight), "started": self.started, "coalesced": self.coalesced}
@@ -0,0 +1,132 @@
+"""Climatology of the model's weather inputs per grid cell and ISO calendar week
+
+Served when live weather is not available in time. A table is a directory:
+    cells.npy      (cells, 2) snapped lat/lng
+    features.npy   (cells, 53, 8) float32 in features.WEATHER_KEYS order, nan where
+                   a week has no data; memory-mapped on load
+
+Built from the Open-Meteo historical archive. The archive has no precipitation
+probability and different soil layers, so future_prob is the share of days with
+rain and sm1-sm3 all use the 0-7 cm soil moisture.
+"""
+import argparse
+import asyncio
+import datetime
+import os
+
+import numpy as np
+
+from features import WEATHER_KEYS
+from weather import API_BASE, AsyncWeatherClient, snap_to_grid
+from weather_features import hourly_matrix, utc_today
+from prefetch import load_locations
+
+CLIMATOLOGY_DIR = "climatology"
+ARCHIVE_URL = os.environ.get("AGRIGRAUD_OPENMETEO_ARCHIVE_URL", API_BASE.replace("api.", "archive-api.", 1) + "/archive")
+ARCHIVE_VARS = ["temperature_2m", "precipitation", "relative_humidity_2m", "soil_moisture_0_to_7cm"]
+ARCHIVE_DELAY_DAYS = 6  # The archive trails real time by about five days
+WEEKS = 53
+
+
+def iso_week(day):
+    return day.isocalendar()[1]
+
+
+class Climatology:
+    """Looks up the climatological weather features of a cell for a calendar week"""
+
+    def __init__(self, cells, features, grid=0.05, max_distance=0.5):
+        self.cells = cells
+        self.features = features
+        self.grid = grid
+        self.max_distance = max_distance
+        self._index = {(float(lat), float(lng)): i for i, (lat, lng) in enumerate(np.asarray(cells))}
+
+    @classmethod
+    def load(cls, path=CLIMATOLOGY_DIR, grid=0.05, max_distance=0.5):
+        return cls(np.load(f"{path}/cells.npy"), np.load(f"{path}/features.npy", mmap_mode="r"), grid, max_distance)
+
+    def lookup(self, lat, lng, week):
+        """Feature dict for the cell containing (lat, lng), or the nearest cell within max_distance degrees"""
+        i = self._index.get(snap_to_grid(lat, lng, self.grid))
+        if i is None:
+            distance = np.abs(self.cells - (lat, lng)).max(axis=1)
+            candidates = np.flatnonzero((distance <= self.max_distance) & ~np.isnan(self.features[:, week - 1, 0]))
+            if len(candidates) == 0:
+                return None
+            i = candidates[np.argmin(distance[candidates])]
+        row = self.features[i, week - 1]
+        if np.isnan(row).any():
+            return None
+        return {key: float(value) for key, value in zip(WEATHER_KEYS, row)}
+
+
+def weekly_features(hourlies, start):
+    """(cells, 53, 8) mean features per ISO week from hourly archive series beginning at start"""
+    n_days = len(hourlies[0]["temperature_2m"]) // 24
+    daily = {name: hourly_matrix(hourlies, name)[:, :24 * n_days].reshape(len(hourlies), n_days, 24)
+             for name in ARCHIVE_VARS}
+    temp = daily["temperature_2m"].mean(axis=2)
+    rain = daily["precipitation"].sum(axis=2)
+    hum = daily["relative_humidity_2m"].mean(axis=2)
+    soil = daily["soil_moisture_0_to_7cm"][:, :, 0]
+
+    # One feature row per day that has the 7 preceding days, as the live service computes it
+    days = np.arange(7, n_days)
+    past = np.stack([np.arange(d - 7, d) for d in days])  # (days, 7)
+    rows = np.stack([
+        temp[:, past].mean(axis=2), temp[:, days], rain[:, past].sum(axis=2),
+        np.concatenate([hum[:, past], hum[:, days, None]], axis=2).mean(axis=2),
+        (rain[:, days] > 0.1).astype(np.float64), soil[:, days], soil[:, days], soil[:, days],
+    ], axis=2)  # (cells, days, 8)
+
+    weeks = np.array([iso_week(start + datetime.timedelta(days=int(d))) - 1 for d in days])
+    valid = ~np.isnan(rows).any(axis=2)
+    sums = np.zeros((len(hourlies), WEEKS, rows.shape[2]))
+    counts = np.zeros((len(hourlies), WEEKS))
+    for w in range(WEEKS):
+        in_week = (weeks == w)[None, :] & valid
+        sums[:, w] = np.where(in_week[:, :, None], np.nan_to_num(rows), 0.0).sum(axis=1)
+        counts[:, w] = in_week.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (sums / counts[:, :, None]).astype(np.float32)
+
+
+async def build(locations, out=CLIMATOLOGY_DIR, years=3, grid=0.05, chunk_size=10, max_concurrent=4):
+    """Writes a climatology table for the grid cells of locations from the Open-Meteo archive"""
+    cells = sorted({snap_to_grid(lat, lng, grid) for lat, lng in locations})
+    end = utc_today() - datetime.timedelta(days=ARCHIVE_DELAY_DAYS)
+    start = end - datetime.timedelta(days=365 * years)
+    client = AsyncWeatherClient()
+    slots = asyncio.Semaphore(max_concurrent)
+
+    async def fetch_chunk(chunk):
+        params = {"latitude": ",".join(str(lat) for lat, _ in chunk),
+                  "longitude": ",".join(str(lng) for _, lng in chunk),
+                  "hourly": ARCHIVE_VARS, "start_date": start.isoformat(), "end_date": end.isoformat()}
+        async with slots:
+            body = await client.get(ARCHIVE_URL, params)
+        body = body if isinstance(body, list) else [body]
+        return weekly_features([r["hourly"] for r in body], start)
+
+    try:
+        chunks = [cells[i:i + chunk_size] for i in range(0, len(cells), chunk_size)]
+        features = np.concatenate(await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks)))
+    finally:
+        await client.aclose()
+
+    os.makedirs(out, exist_ok=True)
+    np.save(f"{out}/cells.npy", np.array(cells, dtype=np.float64).reshape(-1, 2))
+    np.save(f"{out}/features.npy", features)
+    return len(cells)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the weather climatology table for a CSV of fields")
+    parser.add_argument("fields", help="CSV with lat and lng columns")
+    parser.add_argument("--out", default=CLIMATOLOGY_DIR, help="Table directory to write")
+    parser.add_argument("--years", type=int, default=3, help="Years of archive history to average")
+    parser.add_argument("--grid", type=float, default=0.05, help="Grid cell size in degrees")
+    args = parser.parse_args()
+    n_cells = asyncio.run(build(load_locations(args.fields), args.out, args.years, args.grid))
+    print(f"Climatology for {n_cells} grid cells written to {args.out}/")
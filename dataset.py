@@ -0,0 +1,220 @@
+"""Encoded training dataset, cached next to the CSV as typed .npy columns
+
+A cache is a directory:
+    manifest.json   sha256 of the source CSV, row count, feature column names and
+                    the soil, water source and crop classes the codes refer to
+    X.npy           float32 (rows, features) in training column order
+    y.npy           int8 crop codes (int16 past 127 crops)
+    split-<seed>-<test size>.npz
+                    train/test row indices, written the first time a split is asked for
+
+append() adds newly labelled rows without re-encoding the rest; existing rows keep
+their side of every cached split, so a holdout stays unseen across updates.
+
+The scripts memory-map it and skip CSV parsing and encoding while the CSV's hash
+still matches; a changed CSV rebuilds it on the next load. sklearn's forests work
+in float32 anyway, so models trained from the cache are the same as from the CSV.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import LabelEncoder, MultiLabelBinarizer
+
+DATA_PATH = "Hackathon_Training_Data_Final.csv"
+DATASET_DIR = os.environ.get("AGRIGRAUD_DATASET_CACHE", "dataset_cache")
+DATASET_FORMAT = 1
+
+
+def csv_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def encode_dataset(df):
+    """(X, y, soil_le, mlb, label_le) from a training-format DataFrame, without per-row Python"""
+    # 'bore, rainfall' -> one 0/1 column per source, sorted like MultiLabelBinarizer's classes_
+    sources = df["water_source"].str.replace(r"\s*,\s*", ",", regex=True).str.strip()
+    ws_df = sources.str.get_dummies(sep=",")
+    mlb = MultiLabelBinarizer(classes=list(ws_df.columns)).fit([list(ws_df.columns)])
+
+    soil_le = LabelEncoder()
+    label_le = LabelEncoder()
+    X = pd.concat([df.drop(columns=["water_source", "label"]), ws_df], axis=1)
+    X["soil_type"] = soil_le.fit_transform(df["soil_type"])
+    y = label_le.fit_transform(df["label"])
+    return X, y, soil_le, mlb, label_le
+
+
+def _label_encoder(classes):
+    le = LabelEncoder()
+    le.classes_ = np.asarray(classes, dtype=object)
+    return le
+
+
+class EncodedDataset:
+    """Feature matrix, crop codes and the classes behind the codes"""
+
+    def __init__(self, manifest, X, y, path=None):
+        self.manifest = manifest
+        self.X = X
+        self.y = y
+        self.columns = manifest["columns"]
+        self.path = path
+
+    @classmethod
+    def load(cls, path=DATASET_DIR):
+        with open(f"{path}/manifest.json") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != DATASET_FORMAT:
+            raise ValueError(f"Unsupported dataset cache format {manifest.get('format')} in {path}")
+        return cls(manifest, np.load(f"{path}/X.npy", mmap_mode="r"), np.load(f"{path}/y.npy", mmap_mode="r"), path)
+
+    def split(self, test_size=0.2, seed=42):
+        """(train, test) row indices: the rows train_test_split(X, y, ...) picks, plus appended rows"""
+        split_path = f"{self.path}/split-{seed}-{test_size}.npz"
+        try:
+            with np.load(split_path) as split:
+                return split["train"], split["test"]
+        except FileNotFoundError:
+            pass
+        train, test = train_test_split(np.arange(self.manifest["rows"]), test_size=test_size, random_state=seed)
+        np.savez(f"{self.path}/.split.tmp.npz", train=train.astype(np.int32), test=test.astype(np.int32))
+        os.replace(f"{self.path}/.split.tmp.npz", split_path)
+        return train, test
+
+    def append(self, X, y, digest):
+        """Adds encoded rows (the CSV, now hashing to digest, already has them); returns the reloaded cache"""
+        old_rows = self.manifest["rows"]
+        X_all = np.concatenate([self.X, np.asarray(X, dtype=np.float32)])
+        y_all = np.concatenate([self.y, np.asarray(y, dtype=self.y.dtype)])
+        splits = {}
+        for name in os.listdir(self.path):
+            if name.startswith("split-"):
+                seed, test_size = name[len("split-"):-len(".npz")].split("-")
+                splits[name] = self._extend_split(name, old_rows, len(y), int(seed), float(test_size))
+        os.remove(f"{self.path}/manifest.json")
+        _save(self.path, "X", X_all)
+        _save(self.path, "y", y_all)
+        for name, (train, test) in splits.items():
+            np.savez(f"{self.path}/.split.tmp.npz", train=train, test=test)
+            os.replace(f"{self.path}/.split.tmp.npz", f"{self.path}/{name}")
+        _write_manifest(self.path, {**self.manifest, "sha256": digest, "rows": len(y_all)})
+        return EncodedDataset.load(self.path)
+
+    def _extend_split(self, name, old_rows, new_rows, seed, test_size):
+        with np.load(f"{self.path}/{name}") as split:
+            train, test = split["train"], split["test"]
+        # Split only the new rows, seeded by the row count so every append draws afresh
+        is_test = np.random.default_rng([seed, old_rows]).random(new_rows) < test_size
+        added = np.arange(old_rows, old_rows + new_rows, dtype=np.int32)
+        return np.concatenate([train, added[~is_test]]), np.concatenate([test, added[is_test]])
+
+    def frame(self):
+        """X as a DataFrame with the training column names, still backed by the memory map"""
+        return pd.DataFrame(self.X, columns=self.columns, copy=False)
+
+    def encoders(self):
+        """Fitted (soil_le, mlb, label_le) equivalent to the ones encode_dataset returned"""
+        sources = self.manifest["water_sources"]
+        return (_label_encoder(self.manifest["soil_classes"]),
+                MultiLabelBinarizer(classes=sources).fit([sources]),
+                _label_encoder(self.manifest["label_classes"]))
+
+    def matches(self, encoder):
+        """True when the codes mean the same classes as in a model's FeatureEncoder"""
+        return (self.manifest["soil_classes"] == encoder.soil_classes
+                and self.manifest["water_sources"] == encoder.water_sources
+                and self.manifest["label_classes"] == encoder.crop_classes.tolist())
+
+
+def _save(path, name, array):
+    np.save(f"{path}/.{name}.tmp.npy", array)
+    os.replace(f"{path}/.{name}.tmp.npy", f"{path}/{name}.npy")
+
+
+def _write_manifest(path, manifest):
+    with open(f"{path}/.manifest.tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}/.manifest.tmp", f"{path}/manifest.json")
+
+
+def build(csv_path=DATA_PATH, path=DATASET_DIR, digest=None):
+    """Parses and encodes the CSV once and writes the cache"""
+    df = pd.read_csv(csv_path)
+    X, y, soil_le, mlb, label_le = encode_dataset(df)
+    os.makedirs(path, exist_ok=True)
+    # Drop the manifest and the old data's splits first: without a manifest a half-written
+    # cache is never loaded
+    for name in os.listdir(path):
+        if name == "manifest.json" or name.startswith("split-"):
+            os.remove(f"{path}/{name}")
+    _save(path, "X", X.to_numpy(dtype=np.float32))
+    _save(path, "y", y.astype(np.int8 if len(label_le.classes_) < 128 else np.int16))
+    manifest = {
+        "format": DATASET_FORMAT,
+        "source": os.path.basename(csv_path),
+        "sha256": digest or csv_hash(csv_path),
+        "rows": len(df),
+        "columns": [str(c) for c in X.columns],
+        "soil_classes": [str(c) for c in soil_le.classes_],
+        "water_sources": [str(c) for c in mlb.classes_],
+        "label_classes": [str(c) for c in label_le.classes_],
+    }
+    _write_manifest(path, manifest)
+    return EncodedDataset.load(path)
+
+
+def load_dataset(csv_path=DATA_PATH, path=DATASET_DIR):
+    """The cached dataset for csv_path, (re)built first when missing or stale"""
+    digest = csv_hash(csv_path)
+    try:
+        dataset = EncodedDataset.load(path)
+        if dataset.manifest["sha256"] == digest:
+            return dataset
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    return build(csv_path, path, digest)
+
+
+def load_features(encoder, csv_path=DATA_PATH, path=DATASET_DIR):
+    """(X, y) encoded for a loaded model: the cache when its classes match, else from the CSV"""
+    dataset = load_dataset(csv_path, path)
+    if dataset.matches(encoder):
+        return dataset.frame(), dataset.y
+    df = pd.read_csv(csv_path)
+    return encoder.encode_frame(df), encoder.encode_labels(df["label"])
+
+
+def load_split(encoder, test_size=0.2, seed=42, csv_path=DATA_PATH, path=DATASET_DIR):
+    """(X_train, X_test, y_train, y_test) for a loaded model, on the cached split train.py and evaluate.py use
+
+    Split indices are CSV row numbers, so they also apply when the features come from the CSV.
+    """
+    train, test = load_dataset(csv_path, path).split(test_size, seed)
+    X, y = load_features(encoder, csv_path, path)
+    y = np.asarray(y)
+    return X.iloc[train], X.iloc[test], y[train], y[test]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the encoded dataset cache")
+    parser.add_argument("--data", default=DATA_PATH, help="Training CSV")
+    parser.add_argument("--out", default=DATASET_DIR, help="Cache directory")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the hash matches")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    dataset = build(args.data, args.out) if args.force else load_dataset(args.data, args.out)
+    elapsed = time.perf_counter() - start
+    size = dataset.X.nbytes + dataset.y.nbytes
+    print(f"{dataset.manifest['rows']} rows x {len(dataset.columns)} features in {args.out}/ "
+          f"({size / 1024:.0f} KiB, sha256 {dataset.manifest['sha256'][:12]}) in {elapsed * 1000:.1f} ms")
@@ -0,0 +1,189 @@
+"""Evaluation of a model bundle: accuracy, per-class metrics, inference speed, size and load time
+
+    python evaluate.py                                    # the registry's current model
+    python evaluate.py --model models/<version> --out candidate.json
+    python evaluate.py --model models/<version> --baseline production.json   # exit 1 on regression
+
+Features and the train/test split come from the dataset cache (dataset.py), so nothing
+is parsed or re-split. Both sets are scored in chunks on all cores. The JSON report
+holds everything printed; --baseline compares it to an earlier report and fails when
+the candidate is less accurate, slower or larger than the thresholds allow.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+
+from bundle import load_bundle
+from dataset import DATA_PATH, DATASET_DIR, load_dataset
+from registry import load_model, resolve_bundle
+from timing import git_commit, time_batches
+
+BATCH_SIZES = [1, 8, 64, 512]
+
+
+def score(bundle, X, chunk_size=1024, n_jobs=-1):
+    """Class predictions for X, chunks scored in parallel threads (NumPy and sklearn release the GIL)"""
+    chunks = [X[i:i + chunk_size] for i in range(0, len(X), chunk_size)]
+    probs = Parallel(n_jobs=n_jobs, prefer="threads")(delayed(bundle.predict_proba)(chunk) for chunk in chunks)
+    return bundle.model.classes_.take(np.argmax(np.concatenate(probs), axis=1))
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def load_times(path, engine, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        load_bundle(path, engine=engine) if path else load_model(engine=engine)
+        times.append(time.perf_counter() - start)
+    return {"first_ms": times[0] * 1000, "best_ms": min(times) * 1000}
+
+
+def model_size(bundle):
+    if bundle.path is None:
+        return {"bytes": os.path.getsize("crop_model.pkl")}
+    manifest = bundle.manifest
+    return {"bytes": directory_size(bundle.path), "memory_bytes": getattr(bundle.model, "nbytes", None),
+            "forest_bytes": sum(os.path.getsize(f"{bundle.path}/{a['file']}") for a in manifest["arrays"].values()),
+            "nodes": manifest["arrays"]["feature"]["shape"][0],
+            "n_trees": manifest["n_trees"], "max_depth": manifest["max_depth"]}
+
+
+def evaluate(path=None, engine="flat", csv_path=DATA_PATH, cache=DATASET_DIR, test_size=0.2, seed=42,
+             chunk_size=1024, n_jobs=-1, batch_sizes=BATCH_SIZES, min_time=0.5):
+    """Report dict for the bundle at path (default: the one the API would serve)"""
+    # sklearn warns on every call that the matrix has no column names
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    path = path or resolve_bundle()
+    load = load_times(path, engine)
+    bundle = load_bundle(path, engine=engine) if path else load_model(engine=engine)
+
+    dataset = load_dataset(csv_path, cache)
+    if not dataset.matches(bundle.encoder):
+        raise ValueError(f"Model {bundle.version} was trained on different soil, water source or crop classes "
+                         f"than {csv_path}")
+    train, test = dataset.split(test_size, seed)
+    # Score float64 rows, as the API's encoder produces them
+    X = np.asarray(dataset.X, dtype=np.float64)
+    y = np.asarray(dataset.y)
+
+    start = time.perf_counter()
+    train_pred = score(bundle, X[train], chunk_size, n_jobs)
+    test_pred = score(bundle, X[test], chunk_size, n_jobs)
+    scoring_seconds = time.perf_counter() - start
+
+    classes = bundle.encoder.crop_classes.tolist()
+    labels = list(range(len(classes)))
+    per_class = classification_report(y[test], test_pred, labels=labels, target_names=classes,
+                                      output_dict=True, zero_division=0)
+    train_acc, test_acc = accuracy_score(y[train], train_pred), accuracy_score(y[test], test_pred)
+    return {
+        "meta": {"commit": git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "cpus": os.cpu_count(),
+                 "dataset_sha256": dataset.manifest["sha256"], "test_size": test_size, "seed": seed},
+        "model": {"version": bundle.version, "path": path, "engine": engine},
+        "accuracy": {"train": train_acc, "test": test_acc, "gap": train_acc - test_acc,
+                     "macro_f1": per_class["macro avg"]["f1-score"],
+                     "weighted_f1": per_class["weighted avg"]["f1-score"]},
+        "per_class": {name: per_class[name] for name in classes},
+        "confusion_matrix": confusion_matrix(y[test], test_pred, labels=labels).tolist(),
+        "scoring": {"rows": len(X), "seconds": scoring_seconds, "rows_per_second": len(X) / scoring_seconds,
+                    "chunk_size": chunk_size, "n_jobs": n_jobs},
+        "inference": time_batches(bundle, X[test], batch_sizes, min_time),
+        "size": model_size(bundle),
+        "load": load,
+    }
+
+
+def gate(report, baseline, max_accuracy_drop=0.01, max_slowdown=1.5, max_size_ratio=1.5):
+    """Reasons the report regresses against baseline; empty when it may ship"""
+    failures = []
+    drop = baseline["accuracy"]["test"] - report["accuracy"]["test"]
+    if drop > max_accuracy_drop:
+        failures.append(f"test accuracy dropped {drop * 100:.2f} points")
+    old_timings = {t["batch_size"]: t for t in baseline["inference"]}
+    for timing in report["inference"]:
+        before = old_timings.get(timing["batch_size"])
+        if before and timing["latency"]["p50_ms"] > max_slowdown * before["latency"]["p50_ms"]:
+            failures.append(f"batch {timing['batch_size']} p50 {before['latency']['p50_ms']:.3f} -> "
+                            f"{timing['latency']['p50_ms']:.3f} ms")
+    if report["size"]["bytes"] > max_size_ratio * baseline["size"]["bytes"]:
+        failures.append(f"size {baseline['size']['bytes']} -> {report['size']['bytes']} bytes")
+    if report["load"]["best_ms"] > max_slowdown * baseline["load"]["best_ms"]:
+        failures.append(f"load {baseline['load']['best_ms']:.2f} -> {report['load']['best_ms']:.2f} ms")
+    return failures
+
+
+def print_report(report):
+    accuracy = report["accuracy"]
+    print(f"Model {report['model']['version']} ({report['model']['engine']})")
+    print(f"Accuracy: train {accuracy['train'] * 100:.2f}%  test {accuracy['test'] * 100:.2f}%  "
+          f"gap {accuracy['gap'] * 100:.2f}%  macro F1 {accuracy['macro_f1']:.4f}")
+    print(f"\n{'CROP':<14} | {'PRECISION':>9} | {'RECALL':>7} | {'F1':>6} | {'SUPPORT':>7}")
+    print("-" * 55)
+    for name, m in report["per_class"].items():
+        print(f"{name:<14} | {m['precision']:9.3f} | {m['recall']:7.3f} | {m['f1-score']:6.3f} | {m['support']:7.0f}")
+    scoring = report["scoring"]
+    print(f"\nScored {scoring['rows']} rows in {scoring['seconds'] * 1000:.1f} ms "
+          f"({scoring['rows_per_second']:.0f} rows/s)")
+    print(f"\n{'BATCH':>6} | {'P50 (ms)':>9} | {'P95 (ms)':>9} | {'P99 (ms)':>9} | {'ROWS/S':>10}")
+    print("-" * 55)
+    for t in report["inference"]:
+        latency = t["latency"]
+        print(f"{t['batch_size']:>6} | {latency['p50_ms']:9.3f} | {latency['p95_ms']:9.3f} | "
+              f"{latency['p99_ms']:9.3f} | {t['rows_per_second']:10.0f}")
+    print(f"\nSize: {report['size']['bytes'] / 2**20:.2f} MB   "
+          f"Load: {report['load']['first_ms']:.2f} ms first, {report['load']['best_ms']:.2f} ms best")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate a model bundle")
+    parser.add_argument("--model", default=None, help="Bundle directory (default: what the API serves)")
+    parser.add_argument("--engine", default="flat", choices=["flat", "sklearn"])
+    parser.add_argument("--data", default=DATA_PATH, help="Training CSV")
+    parser.add_argument("--dataset-cache", default=DATASET_DIR)
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=1024, help="Rows per parallel scoring call")
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--min-time", type=float, default=0.5, help="Seconds of timing per batch size")
+    parser.add_argument("--out", default=None, help="JSON report path, '-' for stdout only")
+    parser.add_argument("--baseline", default=None, help="Earlier JSON report to gate against")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.01, help="Allowed test accuracy drop (0-1)")
+    parser.add_argument("--max-slowdown", type=float, default=1.5, help="Allowed p50 latency and load time ratio")
+    parser.add_argument("--max-size-ratio", type=float, default=1.5, help="Allowed model size ratio")
+    args = parser.parse_args()
+
+    report = evaluate(args.model, args.engine, args.data, args.dataset_cache, args.test_size, args.seed,
+                      args.chunk_size, args.n_jobs, args.batch_sizes, args.min_time)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["gate"] = {"baseline": baseline["model"]["version"],
+                          "failures": gate(report, baseline, args.max_accuracy_drop, args.max_slowdown,
+                                           args.max_size_ratio)}
+
+    if args.out == "-":
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        print_report(report)
+        out = args.out or f"eval_results/{report['model']['version']}-{args.engine}.json"
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {out}")
+        if args.baseline:
+            for failure in report["gate"]["failures"]:
+                print(f"REGRESSION: {failure}")
+            print("Gate: " + ("FAIL" if report["gate"]["failures"] else f"PASS vs {report['gate']['baseline']}"))
+    if args.baseline and report["gate"]["failures"]:
+        sys.exit(1)
@@ -0,0 +1,148 @@
+"""Feature encoding shared by the API, the console predictors and the evaluation scripts"""
+import itertools
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# Training column order: N, P, K, ph, soil_type, 8 weather/soil moisture columns,
+# then one binary column per water source (bore, canals, rainfall)
+WEATHER_KEYS = ["past_temp", "future_temp", "past_rain", "hum", "future_prob", "sm1", "sm2", "sm3"]
+SOIL_COLUMN = 4
+WEATHER_COLUMNS = slice(5, 13)
+WATER_START = 13
+# Column names of the same inputs in the training CSV format
+CSV_NUTRIENTS = ["N", "P", "K", "ph"]
+CSV_WEATHER = ["past_temp", "future_temp", "past_rainfall", "humidity", "future_precip_prob",
+               "sm_0_1", "sm_1_3", "sm_3_9"]
+
+
+class UnknownSoilType(ValueError):
+    """Raised for soil types the soil encoder was not fitted on"""
+
+    def __init__(self, soil_types, rows=None):
+        self.soil_types = soil_types
+        self.rows = rows
+        where = f" in rows {rows}" if rows is not None else ""
+        super().__init__(f"Unknown soil type{where}: {', '.join(map(str, soil_types))}")
+
+
+class FeatureEncoder:
+    """Turns raw farm inputs into model rows, built once from the fitted encoders
+
+    Soil names are a lower-cased dict lookup, every combination of water sources has a
+    precomputed bit vector, and crop names sit in a NumPy array for top-k selection.
+    """
+
+    def __init__(self, soil_classes, water_sources, crop_classes):
+        self.soil_classes = list(soil_classes)
+        self.water_sources = list(water_sources)
+        self.crop_classes = np.asarray(crop_classes)
+        self.n_features = WATER_START + len(self.water_sources)
+
+        # LabelEncoder codes are positions in classes_. Exact names win, otherwise the
+        # first class matching case-insensitively ("sandy Loamy soil" vs "sandy loamy soil")
+        self._soil_codes = {}
+        for i, s in enumerate(self.soil_classes):
+            self._soil_codes.setdefault(s.lower().strip(), i)
+        self._soil_codes.update({s: i for i, s in enumerate(self.soil_classes)})
+        self._crop_codes = {c: i for i, c in enumerate(self.crop_classes.tolist())}
+        self._water_index = {s: i for i, s in enumerate(self.water_sources)}
+        self._known_water = frozenset(self.water_sources)
+        self._water_bits = {}
+        for r in range(len(self.water_sources) + 1):
+            for combo in itertools.combinations(self.water_sources, r):
+                bits = np.zeros(len(self.water_sources))
+                bits[[self._water_index[s] for s in combo]] = 1
+                self._water_bits[frozenset(combo)] = bits
+        self._template = np.zeros(self.n_features)
+
+    @classmethod
+    def from_fitted(cls, soil_le, mlb, label_le):
+        return cls(soil_le.classes_, mlb.classes_, label_le.classes_)
+
+    @classmethod
+    def load(cls, directory="."):
+        """Builds the encoder from the pickled soil, water source and label encoders"""
+        return cls.from_fitted(
+            joblib.load(f"{directory}/soil_encoder.pkl"),
+            joblib.load(f"{directory}/water_source_mlb.pkl"),
+            joblib.load(f"{directory}/label_encoder.pkl"),
+        )
+
+    def _lookup_soil(self, soil_type):
+        code = self._soil_codes.get(soil_type)
+        return code if code is not None else self._soil_codes.get(soil_type.lower().strip())
+
+    def soil_code(self, soil_type):
+        code = self._lookup_soil(soil_type)
+        if code is None:
+            raise UnknownSoilType([soil_type])
+        return code
+
+    def soil_codes(self, soil_types):
+        codes = [self._lookup_soil(s) for s in soil_types]
+        bad_rows = [i for i, code in enumerate(codes) if code is None]
+        if bad_rows:
+            raise UnknownSoilType(sorted({soil_types[i] for i in bad_rows}), rows=bad_rows)
+        return codes
+
+    def water_bits(self, water_sources):
+        # Unknown sources are ignored, as MultiLabelBinarizer.transform does
+        key = frozenset(s.lower().strip() for s in water_sources) & self._known_water
+        return self._water_bits[key]
+
+    def encode(self, n, p, k, ph, soil_type, env, water_sources, out=None):
+        """Single (1, n_features) row; pass out to fill a preallocated buffer instead"""
+        row = self._template.copy() if out is None else out.reshape(-1)
+        row[:4] = (n, p, k, ph)
+        row[SOIL_COLUMN] = self.soil_code(soil_type)
+        row[WEATHER_COLUMNS] = [env[key] for key in WEATHER_KEYS]
+        row[WATER_START:] = self.water_bits(water_sources)
+        return row.reshape(1, -1)
+
+    def encode_many(self, numeric, soil_types, envs, water_sources):
+        """Feature matrix for many farms: numeric is rows of (n, p, k, ph)"""
+        return self.encode_columns(numeric, soil_types, [[env[key] for key in WEATHER_KEYS] for env in envs],
+                                   [self.water_bits(ws) for ws in water_sources])
+
+    def encode_columns(self, numeric, soil_types, weather, water_bits):
+        """Feature matrix from column blocks: weather is rows in WEATHER_KEYS order,
+        water_bits rows of water_bits() output"""
+        features = np.empty((len(soil_types), self.n_features))
+        features[:, :4] = numeric
+        features[:, SOIL_COLUMN] = self.soil_codes(soil_types)
+        features[:, WEATHER_COLUMNS] = weather
+        features[:, WATER_START:] = water_bits
+        return features
+
+    def encode_frame(self, df):
+        """Feature frame for a training-format DataFrame (water_source as 'bore, rainfall')"""
+        X = df.drop(columns=["water_source", "label"], errors="ignore")
+        X = X.assign(soil_type=self.soil_codes(df["soil_type"].tolist()))
+        # Few distinct water source strings, so encode each once and broadcast
+        sources = df["water_source"].astype("category")
+        bits = np.array([self.water_bits(s.split(",")) for s in sources.cat.categories])
+        ws = pd.DataFrame(bits.reshape(-1, len(self.water_sources))[sources.cat.codes.to_numpy()],
+                          columns=self.water_sources, index=df.index)
+        return pd.concat([X, ws], axis=1)
+
+    def encode_labels(self, labels):
+        return np.array([self._crop_codes[label] for label in labels])
+
+    def top_k(self, probs, k=3):
+        """[{"crop", "confidence"}] for the k most likely crops of one probability row"""
+        return self.top_k_many(np.asarray(probs).reshape(1, -1), k)[0]
+
+    def top_k_many(self, probs, k=3):
+        k = min(k, probs.shape[1])
+        top = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+        top_probs = np.take_along_axis(probs, top, axis=1)
+        order = np.argsort(-top_probs, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        confidences = np.round(np.take_along_axis(top_probs, order, axis=1) * 100, 2).tolist()
+        names = self.crop_classes[top].tolist()
+        return [
+            [{"crop": name, "confidence": conf} for name, conf in zip(row_names, row_confs)]
+            for row_names, row_confs in zip(names, confidences)
+        ]
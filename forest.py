@@ -0,0 +1,156 @@
+"""Random forest inference over flat NumPy arrays, for low-overhead scoring of a few rows"""
+import warnings
+
+import numpy as np
+
+# Rows scored per pass; bounds the (rows, trees, classes) leaf value gather
+CHUNK_ROWS = 512
+
+
+class FlatForest:
+    """A trained RandomForestClassifier compiled into contiguous node arrays
+
+    All trees share one node table, addressed by slot = 2 * node. feature and
+    threshold hold each node's split at both of its slots, and children[slot + 1] is
+    the left child's slot when the split goes left, children[slot] the right one. So a
+    step of the walk is one gather plus a compare. Leaves point back at themselves,
+    which lets every tree walk in lock-step until all of them sit on a leaf.
+    """
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth, classes):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = np.asarray(classes)
+        self.n_trees = len(roots)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for est in model.estimators_:
+            tree = est.tree_
+            n = tree.node_count
+            leaf = tree.children_left == -1
+            own = np.arange(offset, offset + n)
+            left = np.where(leaf, own, tree.children_left + offset)
+            right = np.where(leaf, own, tree.children_right + offset)
+
+            features.append(np.repeat(np.where(leaf, 0, tree.feature), 2))
+            thresholds.append(np.repeat(tree.threshold, 2))
+            children.append(2 * np.stack([right, left], axis=1).ravel())
+            # Leaf class distribution, normalised the way DecisionTreeClassifier.predict_proba does
+            value = tree.value[:, 0, :]
+            values.append(value / value.sum(axis=1, keepdims=True))
+            roots.append(2 * offset)
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n
+
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=np.concatenate(children).astype(np.intp),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            classes=model.classes_,
+        )
+
+    def compact(self):
+        """The same forest with float32 thresholds and leaf values, the bulk of its bytes
+
+        Thresholds are rounded down to the nearest float32, so for the float32 inputs
+        sklearn splits on, x <= threshold decides exactly as before. Leaf values lose
+        precision beyond about 1e-7. Node and feature indices stay intp: narrower ones
+        are upcast on every take() of the walk, which made single rows slower.
+        """
+        threshold = self.threshold.astype(np.float32)
+        rounded_up = threshold.astype(np.float64) > self.threshold
+        threshold[rounded_up] = np.nextafter(threshold[rounded_up], np.float32(-np.inf))
+        return FlatForest(
+            feature=self.feature.astype(np.intp),
+            threshold=threshold,
+            children=self.children.astype(np.intp),
+            value=self.value.astype(np.float32),
+            roots=self.roots.astype(np.intp),
+            max_depth=self.max_depth,
+            classes=self.classes_,
+        )
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.children, self.value, self.roots))
+
+    def apply(self, X):
+        """Leaf node index for every (row, tree)"""
+        # Splits are learned on float32 inputs, so round the same way sklearn does
+        X = np.asarray(X, dtype=np.float32).astype(self.threshold.dtype)
+        n_rows, n_features = X.shape
+        x = X.ravel()
+        slot = np.tile(self.roots, (n_rows, 1)) if n_rows > 1 else self.roots
+        row_offsets = (np.arange(n_rows) * n_features)[:, None] if n_rows > 1 else 0
+        for step in range(self.max_depth):
+            go_left = x.take(self.feature.take(slot) + row_offsets) <= self.threshold.take(slot)
+            next_slot = self.children.take(slot + go_left)
+            # Checking for "all on leaves" costs about one step, so only do it every few
+            if step % 4 == 3 and np.array_equal(next_slot, slot):
+                break
+            slot = next_slot
+        return (slot >> 1).reshape(n_rows, self.n_trees)
+
+    def predict_proba(self, X):
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        proba = np.empty((X.shape[0], self.value.shape[1]))
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            leaves = self.apply(X[start:start + CHUNK_ROWS])
+            values = self.value.take(leaves, axis=0)
+            proba[start:start + CHUNK_ROWS] = values.sum(axis=1, dtype=np.float64) / self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+    def verify(self, model, X=None, n_samples=512, atol=1e-9, seed=0):
+        """Raises ValueError unless predict_proba matches the sklearn model within atol
+
+        Without X, samples random rows spanning every feature's split thresholds.
+        """
+        if X is None:
+            rng = np.random.default_rng(seed)
+            n_features = model.n_features_in_
+            low = np.zeros(n_features)
+            high = np.ones(n_features)
+            internal = self.children[0::2] != np.arange(0, len(self.children), 2)
+            split_feature = self.feature[0::2][internal]
+            split_threshold = self.threshold[0::2][internal]
+            for f in range(n_features):
+                splits = split_threshold[split_feature == f]
+                if splits.size:
+                    low[f], high[f] = splits.min() - 1, splits.max() + 1
+            X = rng.uniform(low, high, size=(n_samples, n_features))
+        X = np.asarray(X, dtype=np.float64)
+        with warnings.catch_warnings():
+            # Models fitted on a DataFrame warn about bare arrays; columns are positional here
+            warnings.simplefilter("ignore", UserWarning)
+            expected = model.predict_proba(X)
+        actual = self.predict_proba(X)
+        max_err = float(np.max(np.abs(expected - actual)))
+        if max_err > atol:
+            raise ValueError(f"Flat forest disagrees with sklearn: max |diff| = {max_err:.3g}")
+        return max_err
+
+
+def compile_forest(model, verify=True, compact=False):
+    """FlatForest for a fitted RandomForestClassifier, checked against it by default"""
+    flat = FlatForest.from_sklearn(model)
+    if compact:
+        flat = flat.compact()
+    if verify:
+        flat.verify(model, atol=1e-6 if compact else 1e-9)
+    return flat
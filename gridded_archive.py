@@ -0,0 +1,101 @@
+"""Reader of the offline gridded weather archive written by weather_archive.py
+
+An archive is a directory:
+    manifest.json   grid origin and step, shape, first day, number of days, variables
+    <variable>.npy  float32 (n_lat, n_lng, hours) for every Open-Meteo variable the
+                    features use, memory-mapped read-only on load
+
+A location maps to its nearest grid point by arithmetic on the grid origin, so a
+lookup is a few array slices and takes microseconds. Only NumPy: scripts that just
+read an archive need not import the HTTP client.
+"""
+import datetime
+import json
+import os
+
+import numpy as np
+
+from weather_features import (PAST_HOURS, SOIL_VARS, WEATHER_VARS, soil_features_many, utc_today,
+                              weather_features_many)
+
+ARCHIVE_DIR = os.environ.get("AGRIGRAUD_WEATHER_ARCHIVE", "weather_archive")
+ARCHIVE_FORMAT = 1
+WINDOW_HOURS = PAST_HOURS + 24
+VARIABLES = WEATHER_VARS + SOIL_VARS
+
+
+class OutsideArchive(ValueError):
+    """A location the archive's grid does not cover"""
+
+
+class GriddedArchive:
+    """Hourly weather on a regular lat/lng grid, read through memory maps"""
+
+    def __init__(self, manifest, arrays):
+        self.manifest = manifest
+        self.arrays = arrays
+        self.lat0, self.lng0 = manifest["lat0"], manifest["lng0"]
+        self.grid = manifest["grid"]
+        self.n_lat, self.n_lng = manifest["shape"]
+        self.start = datetime.date.fromisoformat(manifest["start"])
+        self.hours = manifest["days"] * 24
+        self._warned_days = set()
+
+    @classmethod
+    def load(cls, path=ARCHIVE_DIR):
+        with open(f"{path}/manifest.json") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != ARCHIVE_FORMAT:
+            raise ValueError(f"Unsupported weather archive format {manifest.get('format')} in {path}")
+        arrays = {name: np.load(f"{path}/{name}.npy", mmap_mode="r") for name in manifest["variables"]}
+        return cls(manifest, arrays)
+
+    def cell_index(self, lat, lng):
+        """Nearest grid point; raises OutsideArchive more than half a step beyond the grid"""
+        i = int(round((lat - self.lat0) / self.grid))
+        j = int(round((lng - self.lng0) / self.grid))
+        if not (0 <= i < self.n_lat and 0 <= j < self.n_lng):
+            raise OutsideArchive(f"({lat}, {lng}) is outside the weather archive's extent "
+                                 f"({self.lat0}..{self.lat0 + (self.n_lat - 1) * self.grid}, "
+                                 f"{self.lng0}..{self.lng0 + (self.n_lng - 1) * self.grid})")
+        return i, j
+
+    def contains(self, lat, lng):
+        try:
+            self.cell_index(lat, lng)
+        except OutsideArchive:
+            return False
+        return True
+
+    def window_start(self, day):
+        """First hour of the 7 past days + 1 forecast day window for day
+
+        Days outside the archive use its first or last complete window, with a warning
+        once per day: the archive is stale and needs rebuilding.
+        """
+        first = (day - self.start).days * 24 - PAST_HOURS
+        clamped = min(max(first, 0), self.hours - WINDOW_HOURS)
+        if clamped != first and day not in self._warned_days:
+            self._warned_days.add(day)
+            last = self.start + datetime.timedelta(days=self.hours // 24 - 1)
+            print(f"Warning: weather archive covers {self.start}..{last}, not the window for {day}; "
+                  f"using its {'first' if first < 0 else 'last'} complete window")
+        return clamped
+
+    def features_many(self, locations, day=None):
+        """Feature dicts for (lat, lng) locations, as the live service computes them for day (default today)
+
+        Raises OutsideArchive if any location is outside the grid.
+        """
+        points = [self.cell_index(lat, lng) for lat, lng in locations]
+        if not points:
+            return []
+        t0 = self.window_start(day or utc_today())
+        weather = [{name: self.arrays[name][i, j, t0:t0 + WINDOW_HOURS] for name in WEATHER_VARS} for i, j in points]
+        # The live soil series starts at the beginning of the forecast day
+        soil = [{name: self.arrays[name][i, j, t0 + PAST_HOURS:t0 + WINDOW_HOURS] for name in SOIL_VARS}
+                for i, j in points]
+        return [{**w, **s} for w, s in zip(weather_features_many(weather), soil_features_many(soil))]
+
+    def features(self, lat, lng, day=None):
+        return self.features_many([(lat, lng)], day)[0]
@@ -0,0 +1,100 @@
+"""Model inference off the event loop, on a bounded thread or process pool"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from bundle import load_bundle
+from metrics import REGISTRY
+from registry import load_model
+
+# Models a pool process has loaded, by bundle path (None for the pickles); the newest
+# two are kept so a swap does not evict the version in-flight requests still use
+_worker_models = {}
+_worker_config = {}
+
+
+def _worker_model(path):
+    model = _worker_models.get(path)
+    if model is None:
+        if path is None:
+            model = load_model(_worker_config["directory"], _worker_config["engine"])
+        else:
+            model = load_bundle(path, engine=_worker_config["engine"])
+        _worker_models[path] = model
+        while len(_worker_models) > 2:
+            del _worker_models[next(iter(_worker_models))]
+    return model
+
+
+def _init_worker(directory, engine, path):
+    _worker_config.update(directory=directory, engine=engine)
+    _worker_model(path)
+
+
+def _worker_predict(path, X):
+    return _worker_model(path).predict_proba(X)
+
+
+def _thread_predict(bundle, X):
+    return bundle.predict_proba(X)
+
+
+class PoolSaturated(Exception):
+    """Raised when max_pending model calls are already queued or running"""
+
+
+class InferencePool:
+    """Runs predict_proba on worker threads or processes so the event loop stays free
+
+    Every call names the ModelBundle to score with, so a request keeps the model
+    version it started on across a hot reload. Threads use that bundle directly
+    (NumPy and sklearn release the GIL for most of the work); processes load each
+    version once, from the memory-mapped bundle when there is one. At most
+    max_pending calls are queued or running, further ones fail fast with PoolSaturated.
+    """
+
+    def __init__(self, bundle, kind="thread", workers=None, max_pending=None, directory=".", engine="flat"):
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 4 * self.workers
+        self._pending = 0
+        if kind == "thread":
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="inference")
+        elif kind == "process":
+            self._executor = ProcessPoolExecutor(
+                self.workers, initializer=_init_worker, initargs=(directory, engine, bundle.path))
+        else:
+            raise ValueError(f"Unknown pool kind: {kind}")
+
+        self.saturated = REGISTRY.counter(
+            "agrigraud_inference_rejected_total", "Model calls rejected because the pool was saturated")
+        self.latency = REGISTRY.histogram(
+            "agrigraud_inference_seconds", "Model call time including pool queueing")
+        REGISTRY.gauge("agrigraud_inference_pending", "Model calls queued or running on the pool", fn=lambda: self._pending)
+        REGISTRY.gauge("agrigraud_inference_workers", "Inference pool workers", fn=lambda: self.workers)
+
+    def _call(self, bundle, X):
+        if self.kind == "thread":
+            return _thread_predict, bundle, X
+        return _worker_predict, bundle.path, X
+
+    def warm_up(self, bundle, X):
+        """Runs a call per worker so requests do not pay for loading or first-touch costs"""
+        for future in [self._executor.submit(*self._call(bundle, X)) for _ in range(self.workers)]:
+            future.result()
+
+    async def predict_proba(self, bundle, X):
+        if self._pending >= self.max_pending:
+            self.saturated.inc()
+            raise PoolSaturated(f"Inference pool saturated ({self.max_pending} calls pending)")
+        self._pending += 1
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            return await loop.run_in_executor(self._executor, *self._call(bundle, X))
+        finally:
+            self._pending -= 1
+            self.latency.observe(loop.time() - start)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,14 +1,139 @@
-import joblib
-import numpy as np
-import openmeteo_requests
-import requests_cache
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from retry_requests import retry
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field
 from typing import List
+import numpy as np
+
+from batching import MicroBatcher, QueueFull
+from cache import ResultCache
+from climatology import CLIMATOLOGY_DIR, Climatology
+from registry import ModelWatcher
+from features import UnknownSoilType
+from inference import InferencePool, PoolSaturated
+from metrics import REGISTRY, TimingMiddleware, span
+from prefetch import Prefetcher, load_locations
+from weather import AsyncWeatherClient, OpenMeteoProvider, ResponseCache, WeatherService
+from gridded_archive import ARCHIVE_DIR, GriddedArchive, OutsideArchive
+from weather_archive import ArchiveProvider
+from weather_store import WeatherStore
+
+# "openmeteo" fetches weather live, "archive" reads the offline gridded archive in
+# AGRIGRAUD_WEATHER_ARCHIVE (see weather_archive.py)
+WEATHER_PROVIDER = os.environ.get("AGRIGRAUD_WEATHER_PROVIDER", "openmeteo")
+
+# Weather features per grid cell, e.g. 0.05 degrees is roughly 5 km
+WEATHER_GRID = float(os.environ.get("AGRIGRAUD_WEATHER_GRID", "0.05"))
+WEATHER_TTL = float(os.environ.get("AGRIGRAUD_WEATHER_TTL", "3600"))
+WEATHER_CACHE_SIZE = int(os.environ.get("AGRIGRAUD_WEATHER_CACHE_SIZE", "10000"))
+# SQLite store of raw Open-Meteo responses
+RESPONSE_CACHE = os.environ.get("AGRIGRAUD_RESPONSE_CACHE", "weather_cache.sqlite")
+# Daily weather rollups per cell, so a refresh only fetches the days it lacks; empty disables
+WEATHER_STORE = os.environ.get("AGRIGRAUD_WEATHER_STORE", "weather_store")
+
+# Weather may take at most PREDICT_BUDGET_MS of a request; after that the cell's last known
+# features or its climatology (from CLIMATOLOGY_DIR, if built) are used and the response is
+# flagged degraded. The upstream fetch carries on and fills the cache for later requests.
+PREDICT_BUDGET_MS = float(os.environ.get("AGRIGRAUD_PREDICT_BUDGET_MS", "1000"))
+CLIMATOLOGY = os.environ.get("AGRIGRAUD_CLIMATOLOGY", CLIMATOLOGY_DIR)
+
+# Adds a Server-Timing header with the per-stage timings to every response, for debugging
+TIMING_HEADER = os.environ.get("AGRIGRAUD_TIMING_HEADER", "0") == "1"
+
+# Refresh-ahead for hot locations: up to PREFETCH_MAX cells requested in the last PREFETCH_WINDOW
+# seconds plus any in PREFETCH_FILE (CSV with lat,lng) are refetched PREFETCH_LEAD seconds before expiry,
+# checked every PREFETCH_INTERVAL seconds; a PREFETCH_INTERVAL of 0 disables it
+PREFETCH_FILE = os.environ.get("AGRIGRAUD_PREFETCH_FILE", "")
+PREFETCH_MAX = int(os.environ.get("AGRIGRAUD_PREFETCH_MAX", "5000"))
+PREFETCH_WINDOW = float(os.environ.get("AGRIGRAUD_PREFETCH_WINDOW", "86400"))
+PREFETCH_LEAD = float(os.environ.get("AGRIGRAUD_PREFETCH_LEAD", "300"))
+PREFETCH_INTERVAL = float(os.environ.get("AGRIGRAUD_PREFETCH_INTERVAL", "30"))
+PREFETCH_CONCURRENCY = int(os.environ.get("AGRIGRAUD_PREFETCH_CONCURRENCY", "4"))
+
+# Single /predict rows are scored together: a batch flushes at BATCH_MAX_SIZE rows or
+# BATCH_MAX_WAIT_MS after its first row; beyond BATCH_QUEUE waiting rows we answer 503
+BATCH_MAX_SIZE = int(os.environ.get("AGRIGRAUD_BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("AGRIGRAUD_BATCH_MAX_WAIT_MS", "2"))
+BATCH_QUEUE = int(os.environ.get("AGRIGRAUD_BATCH_QUEUE", "1024"))
 
-app = FastAPI()
+# Model calls run on a "thread" or "process" pool; beyond POOL_MAX_PENDING queued calls we answer 503
+POOL_KIND = os.environ.get("AGRIGRAUD_POOL", "thread")
+POOL_WORKERS = int(os.environ.get("AGRIGRAUD_POOL_WORKERS", str(os.cpu_count() or 1)))
+POOL_MAX_PENDING = int(os.environ.get("AGRIGRAUD_POOL_MAX_PENDING", str(4 * POOL_WORKERS)))
+
+# Inference engine: "sklearn" predict_proba or the compiled "flat" forest
+ENGINE = os.environ.get("AGRIGRAUD_ENGINE", "flat")
+
+# Serve a named variant of the current model version instead of the full forest, e.g.
+# "pruned_compact" on low-end tiers (see variants.py); empty serves the full model
+MODEL_VARIANT = os.environ.get("AGRIGRAUD_MODEL_VARIANT", "") or None
+
+# Repeat feature rows skip the model: up to RESULT_CACHE_SIZE rows, features rounded to
+# RESULT_CACHE_DECIMALS places; a size of 0 disables the cache
+RESULT_CACHE_SIZE = int(os.environ.get("AGRIGRAUD_RESULT_CACHE_SIZE", "10000"))
+RESULT_CACHE_DECIMALS = int(os.environ.get("AGRIGRAUD_RESULT_CACHE_DECIMALS", "2"))
+
+# Seconds between checks of the model registry's CURRENT pointer; 0 disables hot reload
+MODEL_POLL = float(os.environ.get("AGRIGRAUD_MODEL_POLL", "5"))
+
+# Created on startup so the Open-Meteo connection pool and the batch queue live on the server's event loop
+weather = None
+store = None
+prefetcher = None
+models = None
+pool = None
+batcher = None
+results = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_DECIMALS) if RESULT_CACHE_SIZE > 0 else None
+
+async def warm_up(bundle):
+    await asyncio.to_thread(pool.warm_up, bundle, np.zeros((1, bundle.encoder.n_features)))
+
+@asynccontextmanager
+async def lifespan(app):
+    global weather, store, prefetcher, models, pool, batcher
+    # Load Model and Encoders; new registry versions are picked up while serving. A missing
+    # model or variant fails startup with its own error instead of a half-started app
+    models = ModelWatcher(engine=ENGINE, poll_interval=MODEL_POLL, warm_up=warm_up, variant=MODEL_VARIANT)
+    if WEATHER_PROVIDER == "archive":
+        provider = ArchiveProvider(GriddedArchive.load(ARCHIVE_DIR))
+    elif WEATHER_PROVIDER == "openmeteo":
+        # Setup Open-Meteo Client with caching for performance
+        client = AsyncWeatherClient(cache=ResponseCache(RESPONSE_CACHE, expire_after=3600), retries=5,
+                                    backoff_factor=0.2)
+        store = WeatherStore(WEATHER_STORE) if WEATHER_STORE else None
+        provider = OpenMeteoProvider(client, store)
+    else:
+        raise ValueError(f"Unknown weather provider: {WEATHER_PROVIDER}")
+    climatology = None
+    if CLIMATOLOGY and os.path.exists(f"{CLIMATOLOGY}/features.npy"):
+        climatology = Climatology.load(CLIMATOLOGY, grid=WEATHER_GRID)
+    weather = WeatherService(provider, grid=WEATHER_GRID, ttl=WEATHER_TTL, max_cells=WEATHER_CACHE_SIZE,
+                             climatology=climatology)
+    prefetcher = Prefetcher(weather, max_locations=PREFETCH_MAX, lead=PREFETCH_LEAD, interval=PREFETCH_INTERVAL,
+                            window=PREFETCH_WINDOW, max_concurrent=PREFETCH_CONCURRENCY)
+    if PREFETCH_FILE:
+        prefetcher.pin(load_locations(PREFETCH_FILE))
+    pool = InferencePool(models.active, kind=POOL_KIND, workers=POOL_WORKERS, max_pending=POOL_MAX_PENDING, engine=ENGINE)
+    await warm_up(models.active)
+    batcher = MicroBatcher(pool.predict_proba, max_batch=BATCH_MAX_SIZE, max_wait=BATCH_MAX_WAIT_MS / 1000,
+                           max_queue=BATCH_QUEUE, max_concurrent=POOL_WORKERS)
+    batcher.start()
+    watcher = asyncio.create_task(models.watch()) if MODEL_POLL > 0 else None
+    # Warms the pinned locations in the background, so startup does not wait on Open-Meteo
+    refresher = asyncio.create_task(prefetcher.run()) if PREFETCH_INTERVAL > 0 else None
+    yield
+    for task in (watcher, refresher):
+        if task is not None:
+            task.cancel()
+    await batcher.stop()
+    pool.shutdown()
+    await weather.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for your frontend
 app.add_middleware(
@@ -16,21 +141,11 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(TimingMiddleware, header=TIMING_HEADER)
 
-# Setup Open-Meteo Client with caching for performance
-cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-openmeteo = openmeteo_requests.Client(session=retry_session)
-
-# Load Model and Encoders
-try:
-    model = joblib.load('crop_model.pkl')
-    soil_le = joblib.load('soil_encoder.pkl')
-    label_le = joblib.load('label_encoder.pkl')
-    mlb = joblib.load('water_source_mlb.pkl')
-except Exception as e:
-    print(f"Error loading model files: {e}")
+MAX_BATCH_SIZE = 1000
 
 class PredictionRequest(BaseModel):
     n: float
@@ -39,77 +154,165 @@ class PredictionRequest(BaseModel):
     ph: float
     soil_type: str
     water_sources: List[str]
-    lat: float
-    lng: float
-
-def fetch_weather_data(lat, lng):
-    """Fetches environmental and soil data from Open-Meteo"""
-    # 1. Historical & Forecast (Temperature, Rain, Humidity)
-    # We use the forecast endpoint with 'past_days' to get recent historical data
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": lat,
-        "longitude": lng,
-        "hourly": ["temperature_2m", "precipitation", "relative_humidity_2m", "precipitation_probability"],
-        "past_days": 7,
-        "forecast_days": 1
-    }
-    responses = openmeteo.get(url, params=params)
-    res = responses[0]
-    hourly = res.Hourly()
-    
-    # Extract means (simplified for model input)
-    temp_past = np.mean(hourly.Variables(0).ValuesAsNumpy()[:168]) # Last 7 days
-    temp_future = np.mean(hourly.Variables(0).ValuesAsNumpy()[168:]) # Next 24h
-    precip_past = np.sum(hourly.Variables(1).ValuesAsNumpy()[:168])
-    hum_mean = np.mean(hourly.Variables(2).ValuesAsNumpy())
-    future_prob = np.max(hourly.Variables(3).ValuesAsNumpy()[168:]) / 100.0 # Max prob next 24h
-
-    # 2. Soil Moisture (DWD ICON model for high accuracy)
-    soil_url = "https://api.open-meteo.com/v1/dwd-icon"
-    soil_params = {
-        "latitude": lat,
-        "longitude": lng,
-        "hourly": ["soil_moisture_0_to_1cm", "soil_moisture_1_to_3cm", "soil_moisture_3_to_9cm"]
-    }
-    soil_res = openmeteo.get(soil_url, params=soil_params)[0].Hourly()
-    sm1 = soil_res.Variables(0).ValuesAsNumpy()[0] # Current hour
-    sm2 = soil_res.Variables(1).ValuesAsNumpy()[0]
-    sm3 = soil_res.Variables(2).ValuesAsNumpy()[0]
-
-    return {
-        "past_temp": temp_past, "future_temp": temp_future,
-        "past_rain": precip_past, "hum": hum_mean, "future_prob": future_prob,
-        "sm1": sm1, "sm2": sm2, "sm3": sm3
-    }
+    lat: float = Field(ge=-90, le=90)
+    lng: float = Field(ge=-180, le=180)
+
+REGISTRY.gauge("agrigraud_weather_cache_entries", "Grid cells in the weather feature cache",
+               fn=lambda: len(weather.cache) if weather else 0)
+REGISTRY.counter("agrigraud_weather_cache_hits_total", "Weather feature cache hits",
+                 fn=lambda: weather.cache.hits if weather else 0)
+REGISTRY.counter("agrigraud_weather_cache_misses_total", "Weather feature cache misses",
+                 fn=lambda: weather.cache.misses if weather else 0)
+REGISTRY.counter("agrigraud_weather_fetches_coalesced_total", "Weather lookups that joined an in-flight fetch",
+                 fn=lambda: weather.inflight.coalesced if weather else 0)
+REGISTRY.gauge("agrigraud_predict_budget_seconds", "Time a request may wait for weather before falling back",
+               fn=lambda: PREDICT_BUDGET_MS / 1000)
+weather_sources = REGISTRY.counter(
+    "agrigraud_weather_source_total", "Weather rows by source: live, last_known or climatology")
+degraded_responses = REGISTRY.counter(
+    "agrigraud_degraded_responses_total", "Responses that used fallback weather")
+REGISTRY.gauge("agrigraud_prefetch_hot_locations", "Grid cells kept warm by the prefetcher",
+               fn=lambda: len(prefetcher.hot()) if prefetcher else 0)
+REGISTRY.counter("agrigraud_prefetch_refreshed_total", "Grid cells refreshed ahead of expiry",
+                 fn=lambda: prefetcher.refreshed if prefetcher else 0)
+REGISTRY.counter("agrigraud_prefetch_failures_total", "Prefetch rounds that failed",
+                 fn=lambda: prefetcher.failures if prefetcher else 0)
+REGISTRY.counter("agrigraud_weather_store_days_total", "Past weather days per fetch, downloaded or read from the store",
+                 fn=lambda: [({"source": "upstream"}, store.days_fetched),
+                             ({"source": "store"}, store.days_reused)] if store else [])
+REGISTRY.gauge("agrigraud_result_cache_entries", "Feature rows in the prediction result cache",
+               fn=lambda: len(results) if results is not None else 0)
+REGISTRY.counter("agrigraud_result_cache_hits_total", "Predictions served from the result cache",
+                 fn=lambda: results.entries.hits if results is not None else 0)
+REGISTRY.counter("agrigraud_result_cache_misses_total", "Predictions that had to run the model",
+                 fn=lambda: results.entries.misses if results is not None else 0)
+REGISTRY.counter("agrigraud_result_cache_saved_seconds_total", "Model time saved by result cache hits",
+                 fn=lambda: results.saved_seconds if results is not None else 0.0)
+REGISTRY.gauge("agrigraud_model_info", "Model version being served",
+               fn=lambda: [({"version": models.active.version}, 1)] if models else [])
+REGISTRY.counter("agrigraud_model_reloads_total", "Hot model reloads",
+                 fn=lambda: [({"result": "swapped"}, models.swaps), ({"result": "failed"}, models.failures)] if models else [])
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/stats")
+async def stats():
+    return {"weather_cache": weather.cache.stats(), "weather_fetches": weather.inflight.stats(),
+            "prefetch": prefetcher.stats(),
+            "result_cache": results.stats() if results is not None else None,
+            "model": {"version": models.active.version, "variant": MODEL_VARIANT, "swaps": models.swaps,
+                      "failures": models.failures}}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/predict")
 async def predict_crop(req: PredictionRequest):
+    deadline = time.perf_counter() + PREDICT_BUDGET_MS / 1000
+    # The whole request uses the model version that was active when it arrived
+    active = models.active
     try:
-        # Step 1: Automated Weather Retrieval
-        env_data = fetch_weather_data(req.lat, req.lng)
-
-        # Step 2: Encoding User Inputs
-        soil_match = next((s for s in soil_le.classes_ if s.lower() == req.soil_type.lower()), None)
-        soil_encoded = soil_le.transform([soil_match])[0]
-        ws_encoded = mlb.transform([[s.lower() for s in req.water_sources]])
-
-        # Step 3: Feature Assembly (Matching your model's required order)
-        features = [
-            req.n, req.p, req.k, req.ph, soil_encoded,
-            env_data["past_temp"], env_data["future_temp"],
-            env_data["past_rain"], env_data["hum"], env_data["future_prob"],
-            env_data["sm1"], env_data["sm2"], env_data["sm3"]
-        ]
-        final_features = np.array(features + ws_encoded[0].tolist()).reshape(1, -1)
-
-        # Step 4: Predict
-        probs = model.predict_proba(final_features)[0]
-        results = [{"crop": label_le.inverse_transform([i])[0], "confidence": round(p*100, 2)} 
-                   for i, p in enumerate(probs)]
-        results.sort(key=lambda x: x["confidence"], reverse=True)
-
-        return {"top_crops": results[:3], "retrieved_weather": env_data}
+        # Step 1: Automated Weather Retrieval, within the budget or from a fallback
+        with span("weather"):
+            env_data, source = await weather.get_within(req.lat, req.lng, deadline - time.perf_counter())
+        weather_sources.inc(source=source)
+        if source == "live":
+            # Only cells upstream answered for are kept warm
+            prefetcher.touch(req.lat, req.lng)
+        else:
+            degraded_responses.inc()
+
+        # Step 2: Encoding User Inputs and Feature Assembly (training column order)
+        with span("encode"):
+            features = active.encoder.encode(req.n, req.p, req.k, req.ph, req.soil_type, env_data, req.water_sources)
+
+        # Step 3: Predict, batched with other in-flight requests, unless this row was scored before
+        with span("result_cache"):
+            probs = results.get(active.version, features[0], models.active.version) if results is not None else None
+        if probs is None:
+            with span("model") as model_span:
+                probs = await batcher.submit(active, features[0])
+            if results is not None:
+                results.set(active.version, features[0], probs, model_span.elapsed)
+
+        # Step 4: Response, serialized here so its cost shows up as a stage
+        with span("serialize"):
+            return JSONResponse({"top_crops": active.encoder.top_k(probs, 3), "retrieved_weather": env_data,
+                                 "weather_source": source, "degraded": source != "live",
+                                 "model_version": active.version})
+
+    except (UnknownSoilType, OutsideArchive) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (QueueFull, PoolSaturated) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Weather data not available within the request budget")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict/batch")
+async def predict_crop_batch(reqs: List[PredictionRequest]):
+    if not reqs:
+        return {"results": []}
+    if len(reqs) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch size {len(reqs)} exceeds {MAX_BATCH_SIZE}")
+
+    deadline = time.perf_counter() + PREDICT_BUDGET_MS / 1000
+    active = models.active
+    encoder = active.encoder
+    soil_types = [r.soil_type for r in reqs]
+    try:
+        encoder.soil_codes(soil_types)
+    except UnknownSoilType as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # Step 1: Weather for every distinct grid cell, many cells per upstream request
+        with span("weather"):
+            env_rows, sources = await weather.get_many_within([(r.lat, r.lng) for r in reqs],
+                                                              deadline - time.perf_counter())
+        for r, source in zip(reqs, sources):
+            weather_sources.inc(source=source)
+            if source == "live":
+                prefetcher.touch(r.lat, r.lng)
+        degraded = any(source != "live" for source in sources)
+        if degraded:
+            degraded_responses.inc()
+
+        # Step 2: One feature matrix in training column order
+        with span("encode"):
+            features = encoder.encode_many(
+                [[r.n, r.p, r.k, r.ph] for r in reqs], soil_types, env_rows, [r.water_sources for r in reqs]
+            )
+
+        # Step 3: One model call on the inference pool for the rows not in the result cache, then top 3 per row
+        with span("result_cache"):
+            current = models.active.version
+            cached = [results.get(active.version, row, current) if results is not None else None for row in features]
+        misses = [i for i, probs in enumerate(cached) if probs is None]
+        if misses:
+            with span("model") as model_span:
+                scored = await pool.predict_proba(active, features[misses])
+            cost = model_span.elapsed / len(misses)
+            for i, probs in zip(misses, scored):
+                cached[i] = probs
+                if results is not None:
+                    results.set(active.version, features[i], probs, cost)
+        top_crops = encoder.top_k_many(np.stack(cached), 3)
+
+        with span("serialize"):
+            return JSONResponse({"results": [{"top_crops": top, "retrieved_weather": env, "weather_source": source}
+                                             for top, env, source in zip(top_crops, env_rows, sources)],
+                                 "degraded": degraded, "model_version": active.version})
 
+    except OutsideArchive as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PoolSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Weather data not available within the request budget")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
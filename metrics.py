@@ -0,0 +1,202 @@
+"""Minimal in-process metrics registry rendered in the Prometheus text format"""
+import contextvars
+import math
+import threading
+import time
+
+# Latency buckets in seconds, 100 us to 10 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, fn=None):
+        self.name = name
+        self.help = help
+        self.fn = fn  # Callback metrics read their value (or [(labels, value)]) at render time
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        if self.fn is not None:
+            value = self.fn()
+            if isinstance(value, list):
+                return [(self.name, _label_key(labels), v) for labels, v in value]
+            return [(self.name, (), value)]
+        with self._lock:
+            return [(self.name, key, v) for key, v in self._values.items()]
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                out.append((f"{self.name}_bucket", key + (("le", _format_value(bound)),), cumulative))
+            out.append((f"{self.name}_sum", key, total))
+            out.append((f"{self.name}_count", key, cumulative))
+        return out
+
+    def value(self, **labels):
+        counts, total = self._values.get(_label_key(labels), ([0], 0.0))
+        return {"count": sum(counts), "sum": total}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        # Re-registering returns the existing metric, so modules can be reloaded safely
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, fn=None):
+        return self._add(Counter(name, help, fn))
+
+    def gauge(self, name, help, fn=None):
+        return self._add(Gauge(name, help, fn))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# Per-request stage timings: span() adds to the dict of the request being served, which
+# TimingMiddleware installs; tasks started during the request share it
+_spans = contextvars.ContextVar("agrigraud_spans", default=None)
+STAGE_SECONDS = REGISTRY.histogram("agrigraud_stage_seconds", "Time spent per request stage")
+REQUEST_SECONDS = REGISTRY.histogram("agrigraud_request_seconds", "Request latency by route")
+REQUESTS = REGISTRY.counter("agrigraud_requests_total", "Requests by route and status")
+
+
+class span:
+    """Times a block as the named stage: observed in agrigraud_stage_seconds and added to the request's timings"""
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self._start
+        STAGE_SECONDS.observe(self.elapsed, stage=self.stage)
+        spans = _spans.get()
+        if spans is not None:
+            spans[self.stage] = spans.get(self.stage, 0.0) + self.elapsed
+        return False
+
+
+def server_timing(spans):
+    """Server-Timing header value, durations in milliseconds"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in spans.items())
+
+
+class TimingMiddleware:
+    """ASGI middleware recording latency and status per route, optionally echoing the stage timings
+
+    With header=True every response carries a Server-Timing header, which browser dev
+    tools and curl -v show next to the response.
+    """
+
+    def __init__(self, app, header=False):
+        self.app = app
+        self.header = header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        spans = {}
+        token = _spans.set(spans)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.header:
+                    spans["total"] = time.perf_counter() - start
+                    headers = list(message.get("headers", [])) + [(b"server-timing", server_timing(spans).encode())]
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _spans.reset(token)
+            # Label by route template, so unknown paths cannot blow up the label set
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - start, route=route)
+            REQUESTS.inc(route=route, status=str(status))
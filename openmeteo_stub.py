@@ -0,0 +1,101 @@
+"""Local stand-in for the Open-Meteo API, for benchmarks and offline development
+
+Serves /v1/forecast, /v1/dwd-icon and /v1/archive with the JSON shape the weather
+client expects, including comma-separated multi-location requests, past_days /
+forecast_days and start_date / end_date. Values are a deterministic function of the
+location, variable and hour, so repeated runs see the same data. Every request waits
+--latency-ms (plus up to --jitter-ms) and fails with a 502 at --error-rate.
+
+    python openmeteo_stub.py --port 8011 --latency-ms 80 --error-rate 0.01
+    AGRIGRAUD_OPENMETEO_URL=http://127.0.0.1:8011/v1 uvicorn main:app
+"""
+import argparse
+import asyncio
+import datetime
+import random
+import zlib
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+app = FastAPI()
+config = {"latency": 0.05, "jitter": 0.0, "error_rate": 0.0}
+calls = {"requests": 0, "errors": 0, "locations": 0, "hours": 0}
+
+# Rough value ranges per variable, (offset, amplitude)
+RANGES = {"temperature_2m": (18.0, 20.0), "precipitation": (0.0, 2.0), "relative_humidity_2m": (30.0, 65.0),
+          "precipitation_probability": (0.0, 100.0)}
+SOIL_RANGE = (0.1, 0.35)
+
+
+def series(lat, lng, variable, first_hour, hours):
+    """Deterministic hourly values; first_hour counts hours since 0001-01-01"""
+    seed = zlib.crc32(f"{lat:.4f},{lng:.4f},{variable}".encode())
+    offset, amplitude = RANGES.get(variable, SOIL_RANGE)
+    t = np.arange(first_hour, first_hour + hours)
+    noise = np.sin(t * 0.7 + seed % 1000) * np.cos(t * 0.13 + seed % 97)
+    values = offset + amplitude * (0.5 + 0.5 * noise)
+    if variable == "precipitation":
+        values = np.where(noise > 0.6, values, 0.0)
+    return np.round(values, 2).tolist()
+
+
+def date_range(params, endpoint):
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    if "start_date" in params:
+        start = datetime.date.fromisoformat(params["start_date"])
+        end = datetime.date.fromisoformat(params["end_date"])
+        return start, (end - start).days + 1
+    past_days = int(params.get("past_days", 0))
+    forecast_days = int(params.get("forecast_days", 7 if endpoint == "dwd-icon" else 1))
+    return today - datetime.timedelta(days=past_days), past_days + forecast_days
+
+
+@app.get("/v1/{endpoint}")
+async def weather(endpoint: str, request: Request):
+    calls["requests"] += 1
+    await asyncio.sleep(config["latency"] + random.random() * config["jitter"])
+    if random.random() < config["error_rate"]:
+        calls["errors"] += 1
+        return Response(status_code=502)
+
+    params = request.query_params
+    lats = [float(v) for v in params["latitude"].split(",")]
+    lngs = [float(v) for v in params["longitude"].split(",")]
+    variables = params.getlist("hourly")
+    if len(variables) == 1:
+        variables = variables[0].split(",")
+    start, days = date_range(params, endpoint)
+    first_hour, hours = start.toordinal() * 24, days * 24
+    midnight = datetime.datetime.combine(start, datetime.time())
+    calls["locations"] += len(lats)
+    calls["hours"] += hours * len(lats)
+
+    out = [{"latitude": lat, "longitude": lng,
+            "hourly": {"time": [(midnight + datetime.timedelta(hours=h)).isoformat(timespec="minutes")
+                                for h in range(hours)],
+                       **{v: series(lat, lng, v, first_hour, hours) for v in variables}}}
+           for lat, lng in zip(lats, lngs)]
+    return out[0] if len(out) == 1 else out
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/calls")
+async def stats():
+    return calls
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Open-Meteo stub")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Delay before every response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Extra random delay, uniform 0..jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 502")
+    args = parser.parse_args()
+    config.update(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, error_rate=args.error_rate)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
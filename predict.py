@@ -1,14 +1,9 @@
-import joblib
-import numpy as np
-import pandas as pd
+from scoring_client import ScoringError, model_info, score
 
 def predict_crop_console():
-    # 1. Load the Model and Encoders
+    # 1. Reach the scoring daemon, or load the Model and Encoders in process
     try:
-        model = joblib.load('crop_model.pkl')
-        soil_le = joblib.load('soil_encoder.pkl')
-        label_le = joblib.load('label_encoder.pkl')
-        mlb = joblib.load('water_source_mlb.pkl')
+        info = model_info()
     except FileNotFoundError:
         print("Error: Model or Encoder files not found. Please ensure the .pkl files are in the same directory.")
         return
@@ -22,7 +17,7 @@ def predict_crop_console():
         k = float(input("Enter Potassium (K): "))
         ph = float(input("Enter Soil pH (e.g., 6.5): "))
         
-        print(f"Available Soil Types: {list(soil_le.classes_)}")
+        print(f"Available Soil Types: {info['soil_classes']}")
         soil_type = input("Enter Soil Type: ").strip()
         
         past_temp = float(input("Enter Past Average Temperature (°C): "))
@@ -35,41 +30,26 @@ def predict_crop_console():
         sm_1_3 = float(input("Enter Soil Moisture 1-3cm (%): "))
         sm_3_9 = float(input("Enter Soil Moisture 3-9cm (%): "))
         
-        print("Available Water Sources: bore, canals, rainfall")
+        print(f"Available Water Sources: {', '.join(info['water_sources'])}")
         water_source_raw = input("Enter Water Sources (comma separated, e.g., 'bore, rainfall'): ")
         
-        # 3. Preprocessing Categorical Inputs
-        # Encode Soil Type
+        # 3. Weather inputs under the encoder's keys
+        env = {
+            "past_temp": past_temp, "future_temp": future_temp, "past_rain": past_rainfall,
+            "hum": humidity, "future_prob": future_precip_prob,
+            "sm1": sm_0_1, "sm2": sm_1_3, "sm3": sm_3_9
+        }
+
+        # 4. Make Prediction (with confidence, great for Hackathons)
         try:
-            soil_encoded = soil_le.transform([soil_type])[0]
-        except ValueError:
-            print(f"Error: '{soil_type}' is not a recognized soil type.")
+            best = score(n, p, k, ph, soil_type, env, water_source_raw.split(','), top_k=1)[0]
+        except ScoringError as e:
+            if e.kind == "unknown_soil_type":
+                print(f"Error: '{soil_type}' is not a recognized soil type.")
+            else:
+                print(f"Error: {e}")
             return
-
-        # Encode Water Source (Multi-label)
-        # Convert "bore, rainfall" -> ["bore", "rainfall"]
-        ws_list = [s.strip().lower() for s in water_source_raw.split(',')]
-        ws_encoded = mlb.transform([ws_list]) # Returns a 2D array [[1, 0, 1]]
-        
-        # 4. Combine all features into a single vector
-        # Order must match training: N, P, K, ph, soil_type, past_temp, future_temp, 
-        # past_rainfall, humidity, future_precip_prob, sm_0_1, sm_1_3, sm_3_9, bore, canals, rainfall
-        base_features = [
-            n, p, k, ph, soil_encoded, 
-            past_temp, future_temp, past_rainfall, humidity, future_precip_prob,
-            sm_0_1, sm_1_3, sm_3_9
-        ]
-        
-        # Combine base features + the binary columns from mlb
-        final_features = np.array(base_features + ws_encoded[0].tolist()).reshape(1, -1)
-        
-        # 5. Make Prediction
-        prediction_id = model.predict(final_features)
-        crop_name = label_le.inverse_transform(prediction_id)[0]
-        
-        # Get Confidence (Optional but great for Hackathons)
-        proba = model.predict_proba(final_features)
-        confidence = np.max(proba) * 100
+        crop_name, confidence = best["crop"], best["confidence"]
 
         print("\n" + "="*30)
         print(f"RECOMMENDED CROP: {crop_name.upper()}")
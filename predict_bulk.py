@@ -0,0 +1,244 @@
+"""Bulk crop scoring for CSV or JSONL farm files, streamed in chunks
+
+    python predict_bulk.py farms.csv --out scores.csv
+    python predict_bulk.py farms.jsonl --out scores.jsonl --workers 4 --top-k 3
+    cat farms.csv | python predict_bulk.py - --format csv > scores.csv
+
+Input rows use the training CSV columns (N, P, K, ph, soil_type, the eight weather
+and soil moisture columns, water_source as "bore, rainfall"); an optional id column
+is copied to the output. In JSONL, water_source may also be a list. Each chunk of
+--chunk-size rows is parsed and encoded as a matrix and scored in one call, on
+--workers processes that each map the model bundle once. At most two chunks per
+worker are in flight, so memory stays flat however long the input is, and output
+keeps the input order. Rows that cannot be scored go to --rejects with the reason.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bundle import load_bundle, read_manifest
+from features import CSV_NUTRIENTS, CSV_WEATHER, FeatureEncoder, UnknownSoilType
+from registry import load_model, resolve_bundle
+
+REQUIRED = CSV_NUTRIENTS + ["soil_type"] + CSV_WEATHER + ["water_source"]
+
+_worker = {}
+
+
+def _init_worker(path, engine, top_k, out_format):
+    _worker["bundle"] = load_bundle(path, engine=engine) if path else load_model(engine=engine)
+    _worker.update(top_k=top_k, out_format=out_format)
+
+
+def read_chunks(stream, fmt, chunk_size):
+    """(first row number, header, records) per chunk: CSV records are field lists, JSONL ones raw lines"""
+    if fmt == "csv":
+        reader = csv.reader(stream)
+        header = next(reader, None)
+        if header is None:
+            return
+        missing = [c for c in REQUIRED if c not in header]
+        if missing:
+            raise ValueError(f"Input has no {', '.join(missing)} column")
+        records = reader
+    else:
+        header = None
+        records = (line for line in stream if line.strip())
+    start = 1
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield start, header, chunk
+            start += len(chunk)
+            chunk = []
+    if chunk:
+        yield start, header, chunk
+
+
+def _frame(header, records, rejects, start):
+    """DataFrame of the records (one row per record, bad JSON left empty) and its original inputs"""
+    if header is not None:
+        rows = []
+        for i, record in enumerate(records):
+            if len(record) != len(header):
+                # Usually an unquoted "bore, rainfall" spilling into extra fields
+                rejects.append((start + i, f"Expected {len(header)} fields, got {len(record)}", record))
+                record = [None] * len(header)
+            rows.append(record)
+        return pd.DataFrame(rows, columns=header), records
+    objects, inputs = [], []
+    for i, line in enumerate(records):
+        try:
+            obj = json.loads(line)
+            if not isinstance(obj, dict):
+                raise ValueError("not a JSON object")
+            inputs.append(obj)
+        except ValueError as e:
+            rejects.append((start + i, f"Invalid JSON: {e}", line.rstrip("\n")))
+            obj = {}
+            inputs.append(line.rstrip("\n"))
+        objects.append(obj)
+    frame = pd.DataFrame.from_records(objects, columns=sorted({k for o in objects for k in o} | set(REQUIRED)))
+    return frame, inputs
+
+
+def _water_source(value):
+    """water_source as "bore,rainfall"; None when it is neither a string nor a list of strings"""
+    if isinstance(value, list):
+        return ",".join(value) if all(isinstance(s, str) for s in value) else None
+    if value is None or value != value:
+        return ""  # Missing: no water source
+    return value if isinstance(value, str) else None
+
+
+def _top_crops(encoder, bundle, numeric, soil_types, sources, rows, top_k):
+    sources = [sources[i] for i in rows]
+    # Few distinct water source strings: encode each once
+    bits = {s: encoder.water_bits(s.split(",")) for s in set(sources)}
+    X = encoder.encode_columns(numeric[rows, :4], [soil_types[i] for i in rows], numeric[rows, 4:],
+                               [bits[s] for s in sources])
+    return encoder.top_k_many(bundle.predict_proba(X), top_k)
+
+
+def score_chunk(start, header, records):
+    """Scores one chunk in a worker; returns (output text, reject lines, rows scored, rows rejected)"""
+    bundle, top_k, out_format = _worker["bundle"], _worker["top_k"], _worker["out_format"]
+    encoder = bundle.encoder
+    rejects = []
+    frame, inputs = _frame(header, records, rejects, start)
+    bad = np.zeros(len(frame), dtype=bool)
+    bad[[row - start for row, _, _ in rejects]] = True
+
+    numeric = frame[CSV_NUTRIENTS + CSV_WEATHER].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    for i in np.flatnonzero(~np.isfinite(numeric).all(axis=1) & ~bad):
+        columns = [c for c, v in zip(CSV_NUTRIENTS + CSV_WEATHER, numeric[i]) if not np.isfinite(v)]
+        rejects.append((start + i, f"Missing or non-numeric {', '.join(columns)}", inputs[i]))
+        bad[i] = True
+    soil_types = frame["soil_type"].fillna("").astype(str).tolist()
+    for i in np.flatnonzero(~bad):
+        try:
+            encoder.soil_code(soil_types[i])
+        except UnknownSoilType as e:
+            rejects.append((start + i, str(e), inputs[i]))
+            bad[i] = True
+    sources = [_water_source(s) for s in frame["water_source"]]
+    for i in np.flatnonzero(~bad):
+        if sources[i] is None:
+            rejects.append((start + i, "water_source must be a string or a list of strings", inputs[i]))
+            bad[i] = True
+
+    good = np.flatnonzero(~bad)
+    top = _top_crops(encoder, bundle, numeric, soil_types, sources, good, top_k) if len(good) else []
+
+    if header is None:
+        # From the parsed objects: the frame would turn ids missing on some rows into NaN and ints into floats
+        ids = [inputs[i].get("id") for i in good]
+    else:
+        ids = frame["id"].iloc[good].tolist() if "id" in frame.columns else None
+    out = io.StringIO()
+    if out_format == "csv":
+        writer = csv.writer(out)
+        for n, (i, crops) in enumerate(zip(good, top)):
+            writer.writerow([start + i, ids[n] if ids is not None else ""]
+                            + [v for crop in crops for v in (crop["crop"], crop["confidence"])])
+    else:
+        for n, (i, crops) in enumerate(zip(good, top)):
+            record = {"row": int(start + i)}
+            if ids is not None and ids[n] is not None:
+                record["id"] = ids[n]
+            record["top_crops"] = crops
+            out.write(json.dumps(record) + "\n")
+
+    if header is not None:
+        # Rows with the wrong field count keep their raw fields: the extra ones explain the error
+        rejects = [(row, error, dict(zip(header, record)) if len(record) == len(header) else record)
+                   for row, error, record in rejects]
+    reject_lines = [json.dumps({"row": int(row), "error": error, "input": record}, default=str)
+                    for row, error, record in sorted(rejects, key=lambda r: r[0])]
+    return out.getvalue(), reject_lines, len(good), len(rejects)
+
+
+def csv_header(top_k):
+    # id stays empty for inputs without one
+    return ["row", "id"] + [f"{name}_{rank}" for rank in range(1, top_k + 1) for name in ("crop", "confidence")]
+
+
+def run(args):
+    fmt = args.format or ("jsonl" if args.input.endswith((".jsonl", ".ndjson")) else "csv")
+    out_format = args.out_format or ("jsonl" if (args.out or "").endswith((".jsonl", ".ndjson")) else "csv")
+    path = args.model or resolve_bundle(variant=args.variant)
+    # More ranks than crops would give header columns that no row fills
+    crops = read_manifest(path)["classes"] if path else FeatureEncoder.load().crop_classes
+    top_k = min(args.top_k, len(crops))
+    source = sys.stdin if args.input == "-" else open(args.input, newline="")
+    out = open(args.out, "w", newline="") if args.out else sys.stdout
+    rejects_path = args.rejects or (f"{args.out}.rejects.jsonl" if args.out else "rejects.jsonl")
+    rejects = open(rejects_path, "w")
+    scored = rejected = 0
+    started = time.perf_counter()
+    if out_format == "csv":
+        # Same writer settings as score_chunk, so the header has the rows' line endings
+        csv.writer(out).writerow(csv_header(top_k))
+
+    def write(result):
+        nonlocal scored, rejected
+        text, reject_lines, n_scored, n_rejected = result
+        out.write(text)
+        rejects.writelines(line + "\n" for line in reject_lines)
+        scored += n_scored
+        rejected += n_rejected
+
+    try:
+        chunks = read_chunks(source, fmt, args.chunk_size)
+        if args.workers <= 1:
+            _init_worker(path, args.engine, top_k, out_format)
+            for start, header, records in chunks:
+                write(score_chunk(start, header, records))
+        else:
+            with ProcessPoolExecutor(args.workers, initializer=_init_worker,
+                                     initargs=(path, args.engine, top_k, out_format)) as pool:
+                pending = deque()
+                for start, header, records in chunks:
+                    pending.append(pool.submit(score_chunk, start, header, records))
+                    if len(pending) >= 2 * args.workers:
+                        write(pending.popleft().result())
+                while pending:
+                    write(pending.popleft().result())
+    finally:
+        for f in (source, out, rejects):
+            if f not in (sys.stdin, sys.stdout):
+                f.close()
+    elapsed = time.perf_counter() - started
+    print(f"Scored {scored} rows, rejected {rejected} (see {rejects_path}) in {elapsed:.1f} s "
+          f"({(scored + rejected) / max(elapsed, 1e-9):.0f} rows/s)", file=sys.stderr)
+    return scored, rejected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a CSV or JSONL file of farms")
+    parser.add_argument("input", help="CSV or JSONL file, '-' for stdin")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None, help="Input format (default: by extension)")
+    parser.add_argument("--out", default=None, help="Output file (default stdout)")
+    parser.add_argument("--out-format", choices=["csv", "jsonl"], default=None,
+                        help="Output format (default: by --out extension, else csv)")
+    parser.add_argument("--rejects", default=None, help="Rejected rows, JSONL (default <out>.rejects.jsonl)")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--engine", choices=["flat", "sklearn"], default="flat")
+    parser.add_argument("--model", default=None, help="Bundle directory (default: the registry's current model)")
+    parser.add_argument("--variant", default=None, help="Variant of the current model (see variants.py)")
+    args = parser.parse_args()
+    if args.top_k < 1:
+        parser.error("--top-k must be at least 1")
+    run(args)
@@ -0,0 +1,84 @@
+"""Refresh-ahead of weather features for the locations farmers actually ask about"""
+import asyncio
+import csv
+import time
+from collections import OrderedDict
+
+from weather import snap_to_grid
+
+
+def load_locations(path):
+    """(lat, lng) pairs from a CSV with lat and lng columns, e.g. the registered fields"""
+    with open(path, newline="") as f:
+        return [(float(row["lat"]), float(row["lng"])) for row in csv.DictReader(f)]
+
+
+class Prefetcher:
+    """Keeps a WeatherService's cache warm for hot grid cells
+
+    Hot cells are the max_locations most recently requested ones seen within window
+    seconds, plus any pinned from a file. Every interval seconds, hot cells that are
+    missing or expire within lead seconds are refetched in bulk, at most max_concurrent
+    upstream chunks at a time, so requests keep hitting a fresh cache entry.
+    """
+
+    def __init__(self, service, max_locations=5000, lead=300, interval=30, window=86400, max_concurrent=4,
+                 clock=time.monotonic):
+        self.service = service
+        self.max_locations = max_locations
+        self.lead = lead
+        self.interval = interval
+        self.window = window
+        self.max_concurrent = max_concurrent
+        self._clock = clock
+        self.recent = OrderedDict()  # cell -> last request time, least recent first
+        self.pinned = set()
+        self.refreshed = 0
+        self.failures = 0
+
+    def touch(self, lat, lng):
+        """Records a request for (lat, lng); call it once its weather was fetched, so bad cells never get hot"""
+        cell = snap_to_grid(lat, lng, self.service.grid)
+        self.recent[cell] = self._clock()
+        self.recent.move_to_end(cell)
+        while len(self.recent) > self.max_locations:
+            self.recent.popitem(last=False)
+
+    def pin(self, locations):
+        self.pinned.update(snap_to_grid(lat, lng, self.service.grid) for lat, lng in locations)
+
+    def hot(self):
+        cutoff = self._clock() - self.window
+        return self.pinned | {cell for cell, seen in self.recent.items() if seen >= cutoff}
+
+    def due(self):
+        """Hot cells that are not cached or expire within lead seconds"""
+        cache = self.service.cache
+        return [cell for cell in self.hot() if (cache.ttl_left(cell) or 0.0) <= self.lead]
+
+    async def refresh(self):
+        cells = self.due()
+        if cells:
+            failed = await self.service.refresh_many(cells, max_concurrent=self.max_concurrent)
+            self.refreshed += len(cells) - len(failed)
+            if failed:
+                # The other cells were refreshed; these are retried next round
+                self.failures += 1
+                cell, error = next(iter(failed.items()))
+                print(f"Weather prefetch failed for {len(failed)} of {len(cells)} cells, e.g. {cell}: {error}")
+        return len(cells)
+
+    async def run(self):
+        """Warms the hot cells right away, then keeps refreshing them ahead of expiry"""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Requests still fall back to fetching on a miss; try again next round
+                self.failures += 1
+                print(f"Weather prefetch failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self):
+        return {"hot": len(self.hot()), "pinned": len(self.pinned), "refreshed": self.refreshed,
+                "failures": self.failures}
@@ -1,9 +1,14 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import joblib
-import numpy as np
 from typing import List
+import os
+import sys
+
+# Shared encoder lives in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from registry import load_artifacts
+from features import UnknownSoilType
 
 app = FastAPI()
 
@@ -17,10 +22,7 @@ app.add_middleware(
 
 # 1. Load Model and Encoders once at startup
 try:
-    model = joblib.load('crop_model.pkl')
-    soil_le = joblib.load('soil_encoder.pkl')
-    label_le = joblib.load('label_encoder.pkl')
-    mlb = joblib.load('water_source_mlb.pkl')
+    model, encoder = load_artifacts()
 except Exception as e:
     print(f"Error loading model files: {e}")
 
@@ -44,37 +46,19 @@ class PredictionRequest(BaseModel):
 @app.post("/predict")
 async def predict_crop(req: PredictionRequest):
     try:
-        # Handle Soil Encoding
-        soil_match = next((s for s in soil_le.classes_ if s.lower() == req.soil_type.lower()), None)
-        if not soil_match:
-            raise HTTPException(status_code=400, detail=f"Invalid soil type: {req.soil_type}")
-        
-        soil_encoded = soil_le.transform([soil_match])[0]
-
-        # Handle Water Sources Encoding
-        ws_list = [s.strip().lower() for s in req.water_sources]
-        ws_encoded = mlb.transform([ws_list])
+        # Encode soil type and water sources, then assemble the feature vector
+        env = {
+            "past_temp": req.past_temp, "future_temp": req.future_temp, "past_rain": req.past_rain,
+            "hum": req.hum, "future_prob": req.future_prob, "sm1": req.sm1, "sm2": req.sm2, "sm3": req.sm3
+        }
+        final_features = encoder.encode(req.n, req.p, req.k, req.ph, req.soil_type, env, req.water_sources)
 
-        # 3. Assemble Feature Vector
-        base_features = [
-            req.n, req.p, req.k, req.ph, soil_encoded, 
-            req.past_temp, req.future_temp, req.past_rain, req.hum, req.future_prob,
-            req.sm1, req.sm2, req.sm3
-        ]
-        final_features = np.array(base_features + ws_encoded[0].tolist()).reshape(1, -1)
-
-        # 4. Predict
+        # 4. Predict and return top 3
         probabilities = model.predict_proba(final_features)[0]
-        
-        results = []
-        for i, prob in enumerate(probabilities):
-            crop_name = label_le.inverse_transform([i])[0]
-            results.append({"crop": crop_name, "confidence": round(prob * 100, 2)})
-
-        # Sort and return top 3
-        results.sort(key=lambda x: x["confidence"], reverse=True)
-        return {"top_crops": results[:3]}
+        return {"top_crops": encoder.top_k(probabilities, 3)}
 
+    except UnknownSoilType:
+        raise HTTPException(status_code=400, detail=f"Invalid soil type: {req.soil_type}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,215 @@
+"""Versioned model registry and the model loader every entry point uses
+
+Layout:
+    models/<version>/   one bundle per trained model (see bundle.py)
+    models/<version>/variants/<name>/
+                        optional smaller or faster bundles of the same model (see variants.py)
+    models/CURRENT      name of the version to serve, replaced atomically on activate
+
+A deployment serves the current version's named variant instead of the full model
+by passing variant= (AGRIGRAUD_MODEL_VARIANT for the API).
+
+Entry points resolve a model as: the registry's CURRENT version, else a bare
+model_bundle/ directory, else the four pickles train.py used to write on their own.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+
+import joblib
+
+from bundle import BUNDLE_DIR, ModelBundle, benchmark, load_bundle, read_manifest, write_bundle
+from features import FeatureEncoder
+from forest import compile_forest
+
+REGISTRY_DIR = os.environ.get("AGRIGRAUD_MODEL_REGISTRY", "models")
+POINTER = "CURRENT"
+VARIANTS_DIR = "variants"
+
+
+def _registry_path(directory=".", registry=None):
+    return os.path.join(directory, registry or REGISTRY_DIR)
+
+
+def version_path(version, directory=".", registry=None, variant=None):
+    path = os.path.join(_registry_path(directory, registry), version)
+    return os.path.join(path, VARIANTS_DIR, variant) if variant else path
+
+
+def list_versions(directory=".", registry=None):
+    path = _registry_path(directory, registry)
+    if not os.path.isdir(path):
+        return []
+    return sorted(v for v in os.listdir(path) if os.path.exists(os.path.join(path, v, "manifest.json")))
+
+
+def current_version(directory=".", registry=None):
+    try:
+        with open(os.path.join(_registry_path(directory, registry), POINTER)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def activate(version, directory=".", registry=None):
+    """Points CURRENT at version; readers see either the old or the new name, never half"""
+    path = _registry_path(directory, registry)
+    if not os.path.exists(os.path.join(path, version, "manifest.json")):
+        raise ValueError(f"No model version {version} in {path}")
+    tmp = os.path.join(path, f".{POINTER}.tmp")
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(path, POINTER))
+
+
+def list_variants(version, directory=".", registry=None):
+    path = os.path.join(version_path(version, directory, registry), VARIANTS_DIR)
+    if not os.path.isdir(path):
+        return []
+    return sorted(v for v in os.listdir(path) if os.path.exists(os.path.join(path, v, "manifest.json")))
+
+
+def publish(model, soil_le, mlb, label_le, directory=".", registry=None, version=None, make_current=True,
+            variants=None, lineage=None):
+    """Writes a new bundle version into the registry and, by default, activates it
+
+    variants maps names to (model, compact) pairs written alongside, so the version
+    is never current without them.
+    """
+    path = _registry_path(directory, registry)
+    if version is not None and os.path.exists(os.path.join(path, version)):
+        raise ValueError(f"Model version {version} already exists in {path}")
+    os.makedirs(path, exist_ok=True)
+    # Write under a temporary name first, the version string comes from the manifest; a
+    # crashed earlier publish may have left one behind
+    incoming = os.path.join(path, ".incoming")
+    shutil.rmtree(incoming, ignore_errors=True)
+    try:
+        manifest = write_bundle(incoming, model, soil_le, mlb, label_le, version=version, lineage=lineage)
+        for name, (variant, compact) in (variants or {}).items():
+            # A compact forest has no sklearn counterpart worth shipping
+            write_bundle(os.path.join(incoming, VARIANTS_DIR, name), variant, soil_le, mlb, label_le,
+                         version=f"{manifest['version']}+{name}", include_sklearn=not compact, compact=compact)
+        if os.path.exists(os.path.join(path, manifest["version"])):
+            raise ValueError(f"Model version {manifest['version']} already exists in {path}")
+        os.replace(incoming, os.path.join(path, manifest["version"]))
+    except BaseException:
+        shutil.rmtree(incoming, ignore_errors=True)
+        raise
+    if make_current:
+        activate(manifest["version"], directory, registry)
+    return manifest
+
+
+def resolve_bundle(directory=".", registry=None, variant=None):
+    """Path of the bundle to serve, or None when only the pickles exist"""
+    version = current_version(directory, registry)
+    if variant:
+        if version is None:
+            raise ValueError(f"Model variant {variant} requested but the registry has no current version")
+        path = version_path(version, directory, registry, variant)
+        if not os.path.exists(os.path.join(path, "manifest.json")):
+            raise ValueError(f"Model version {version} has no variant {variant}")
+        return path
+    if version is not None:
+        return version_path(version, directory, registry)
+    if os.path.exists(os.path.join(directory, BUNDLE_DIR, "manifest.json")):
+        return os.path.join(directory, BUNDLE_DIR)
+    return None
+
+
+def load_model(directory=".", engine="flat", variant=None):
+    """ModelBundle for the model to serve: registry, bare bundle or pickles"""
+    path = resolve_bundle(directory, variant=variant)
+    if path is not None:
+        return load_bundle(path, engine=engine)
+
+    model = joblib.load(os.path.join(directory, "crop_model.pkl"))
+    if engine == "flat":
+        model = compile_forest(model)
+    elif engine != "sklearn":
+        raise ValueError(f"Unknown inference engine: {engine}")
+    return ModelBundle(model, FeatureEncoder.load(directory), {"version": "pickles"})
+
+
+def load_artifacts(directory=".", engine="sklearn"):
+    """Loads the trained model and a FeatureEncoder for it
+
+    engine="flat" scores with a forest.FlatForest (verified against sklearn when
+    compiled from the pickle), engine="sklearn" with the original estimator.
+    """
+    loaded = load_model(directory, engine)
+    return loaded.model, loaded.encoder
+
+
+class ModelWatcher:
+    """Serves the registry's current model and swaps in new versions without a restart
+
+    watch() polls the CURRENT pointer. A new version is loaded off the event loop and
+    warmed up before it replaces active, so requests that already hold the previous
+    ModelBundle finish on it and nobody pays for the new model's cold start.
+    """
+
+    def __init__(self, directory=".", engine="flat", poll_interval=5.0, warm_up=None, variant=None):
+        self.directory = directory
+        self.engine = engine
+        self.variant = variant
+        self.poll_interval = poll_interval
+        self.warm_up = warm_up  # async callable(ModelBundle), run before a swap
+        self.active = load_model(directory, engine, variant)
+        self.swaps = 0
+        self.failures = 0
+
+    async def refresh(self):
+        """Swaps to the current registry version if it changed; True when it did"""
+        path = resolve_bundle(self.directory, variant=self.variant)
+        if path is None or path == self.active.path:
+            return False
+        candidate = await asyncio.to_thread(load_bundle, path, self.engine)
+        if self.warm_up is not None:
+            await self.warm_up(candidate)
+        previous, self.active = self.active, candidate
+        self.swaps += 1
+        print(f"Model reloaded: {previous.version} -> {candidate.version}")
+        return True
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Keep serving the old model; a half-written or broken version is retried next poll
+                self.failures += 1
+                print(f"Model reload failed: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Model registry tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List versions, marking the current one")
+    sub.add_parser("current", help="Print the current version's manifest")
+    activate_cmd = sub.add_parser("activate", help="Serve a version (deploy or roll back)")
+    activate_cmd.add_argument("version")
+    sub.add_parser("benchmark", help="Compare pickle and bundle load times for the current model")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        current = current_version()
+        for version in list_versions():
+            variants = ", ".join(list_variants(version))
+            print(f"{'*' if version == current else ' '} {version}" + (f"  variants: {variants}" if variants else ""))
+    elif args.command == "current":
+        path = resolve_bundle()
+        print(read_manifest(path) if path else "No bundle, serving the pickles")
+    elif args.command == "activate":
+        activate(args.version)
+        print(f"Current model: {args.version}")
+    elif args.command == "benchmark":
+        print(f"{'LOAD PATH':<28} | BEST OF 5 (ms)")
+        print("-" * 45)
+        for name, ms in benchmark(bundle_path=resolve_bundle()).items():
+            print(f"{name:<28} | {ms:10.2f}")
@@ -0,0 +1,84 @@
+"""Thin client of the scoring daemon (scoring_daemon.py) for the console tools
+
+Imports only the standard library, so a CLI run costs an interpreter start and one
+round trip on the Unix socket. Without a daemon the same request is answered in
+process, which loads NumPy and the model on first use.
+"""
+import json
+import os
+import socket
+import stat
+
+# Per-user runtime directory where there is one; tempfile would cost more to import than a request
+SOCKET_PATH = os.environ.get(
+    "AGRIGRAUD_SOCKET",
+    os.path.join(os.environ.get("XDG_RUNTIME_DIR") or os.environ.get("TMPDIR") or "/tmp",
+                 f"agrigraud-{os.getuid()}.sock" if hasattr(os, "getuid") else "agrigraud.sock"))
+TIMEOUT = 5.0
+
+_local = {}
+
+
+class ScoringError(Exception):
+    """A request the model could not score; kind is e.g. "unknown_soil_type" or "bad_request\""""
+
+    def __init__(self, message, kind=None):
+        super().__init__(message)
+        self.kind = kind
+
+
+def owned_socket(path):
+    """True when path is a socket of this user; in a shared /tmp anything else may be another user's listener"""
+    try:
+        st = os.lstat(path)  # Not a symlink someone else planted either
+    except OSError:
+        return False
+    return stat.S_ISSOCK(st.st_mode) and (not hasattr(os, "getuid") or st.st_uid == os.getuid())
+
+
+def request_daemon(payload, path=SOCKET_PATH, timeout=TIMEOUT):
+    """The daemon's response to payload, or None when no daemon of this user answers"""
+    if not hasattr(socket, "AF_UNIX") or not owned_socket(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(json.dumps(payload).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+    except OSError:
+        # No socket, nobody listening, or the daemon stalled: score in process instead
+        return None
+    return json.loads(line) if line else None
+
+
+def _local_bundle():
+    if "bundle" not in _local:
+        # Heavy imports, only paid when no daemon is running
+        from registry import load_model
+        _local["bundle"] = load_model(engine="flat")
+    return _local["bundle"]
+
+
+def call(payload, path=SOCKET_PATH):
+    """Response to payload from the daemon, or computed in process; raises ScoringError"""
+    response = request_daemon(payload, path)
+    if response is None:
+        from scoring_daemon import handle_request
+        response = handle_request(_local_bundle(), payload)
+    if "error" in response:
+        raise ScoringError(response["error"], response.get("kind"))
+    return response
+
+
+def model_info(path=SOCKET_PATH):
+    """{"version", "soil_classes", "water_sources", "crops"} of the model that scores"""
+    return call({"op": "info"}, path)
+
+
+def score(n, p, k, ph, soil_type, env, water_sources, top_k=3, path=SOCKET_PATH):
+    """[{"crop", "confidence"}] for one farm, best first; env holds features.WEATHER_KEYS"""
+    payload = {"op": "score", "n": n, "p": p, "k": k, "ph": ph, "soil_type": soil_type, "env": env,
+               "water_sources": list(water_sources), "top_k": top_k}
+    return call(payload, path)["top_crops"]
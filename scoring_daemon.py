@@ -0,0 +1,126 @@
+"""Local scoring daemon: keeps the model loaded for predict.py and predict3.py
+
+    python scoring_daemon.py                       # listens on scoring_client.SOCKET_PATH
+    python scoring_daemon.py --socket /run/agrigraud.sock --variant compact
+    AGRIGRAUD_SOCKET=/run/agrigraud.sock python predict3.py
+
+Each CLI run otherwise imports pandas and scikit-learn and loads the model to score a
+single row. The daemon pays that once and answers newline-delimited JSON requests on
+a Unix socket (owner-only permissions), one response line per request line:
+
+    {"op": "info"}  -> {"version", "soil_classes", "water_sources", "crops"}
+    {"op": "score", "n", "p", "k", "ph", "soil_type", "env", "water_sources", "top_k"}
+                    -> {"version", "top_crops": [{"crop", "confidence"}]}
+
+Failures come back as {"error", "kind"}. The daemon follows the registry's CURRENT
+pointer like the API does, so activating a version needs no restart.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+
+import numpy as np
+
+from features import WEATHER_KEYS, UnknownSoilType
+from registry import ModelWatcher
+from scoring_client import SOCKET_PATH, owned_socket, request_daemon
+
+
+def handle_request(bundle, payload):
+    """Response dict for one request; errors are returned, not raised, so clients can report them"""
+    encoder = bundle.encoder
+    op = payload.get("op", "score")
+    if op == "info":
+        return {"version": bundle.version, "soil_classes": encoder.soil_classes,
+                "water_sources": encoder.water_sources, "crops": encoder.crop_classes.tolist()}
+    if op != "score":
+        return {"error": f"Unknown op {op!r}", "kind": "bad_request"}
+    try:
+        water_sources = payload["water_sources"]
+        if not isinstance(water_sources, list) or not all(isinstance(s, str) for s in water_sources):
+            raise TypeError("water_sources must be a list of strings")
+        env = {key: float(payload["env"][key]) for key in WEATHER_KEYS}
+        row = encoder.encode(float(payload["n"]), float(payload["p"]), float(payload["k"]), float(payload["ph"]),
+                             str(payload["soil_type"]), env, water_sources)
+        top_k = int(payload.get("top_k", 3))
+        if top_k < 1:
+            raise ValueError("top_k must be at least 1")
+    except UnknownSoilType as e:
+        return {"error": str(e), "kind": "unknown_soil_type"}
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return {"error": f"Bad request: {e!r}", "kind": "bad_request"}
+    return {"version": bundle.version, "top_crops": encoder.top_k(bundle.predict_proba(row)[0], top_k)}
+
+
+async def warm_up(bundle):
+    # First predict_proba pages in the memory-mapped forest
+    bundle.predict_proba(np.zeros((1, bundle.encoder.n_features)))
+
+
+def claim_socket(path):
+    """Removes a stale socket file; refuses to start when another daemon answers on it"""
+    if not os.path.lexists(path):
+        return
+    if not owned_socket(path):
+        raise SystemExit(f"{path} is not a socket of this user; set AGRIGRAUD_SOCKET to a private path")
+    if request_daemon({"op": "info"}, path, timeout=1.0) is not None:
+        raise SystemExit(f"A scoring daemon is already listening on {path}")
+    os.unlink(path)
+
+
+async def serve(path=SOCKET_PATH, directory=".", engine="flat", variant=None, poll_interval=5.0):
+    # Step 1: Load and warm the model once
+    models = ModelWatcher(directory, engine, poll_interval, warm_up=warm_up, variant=variant)
+    await warm_up(models.active)
+
+    async def handle(reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    payload = json.loads(line)
+                    if not isinstance(payload, dict):
+                        raise ValueError("not a JSON object")
+                    response = handle_request(models.active, payload)
+                except ValueError as e:
+                    response = {"error": f"Invalid JSON: {e}", "kind": "bad_request"}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    # Step 2: Listen on the socket, readable and writable by this user only
+    claim_socket(path)
+    umask = os.umask(0o177)
+    try:
+        server = await asyncio.start_unix_server(handle, path)
+    finally:
+        os.umask(umask)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, server.close)
+    print(f"Scoring daemon serving model {models.active.version} ({engine}) on {path}")
+
+    # Step 3: Serve until stopped, following the registry's current version
+    watcher = asyncio.create_task(models.watch())
+    try:
+        async with server:
+            await server.wait_closed()
+    finally:
+        watcher.cancel()
+        if os.path.exists(path):
+            os.unlink(path)
+    print("Scoring daemon stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the model loaded for the console tools")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Unix socket path (env AGRIGRAUD_SOCKET)")
+    parser.add_argument("--engine", choices=["flat", "sklearn"], default="flat")
+    parser.add_argument("--variant", default=None, help="Variant of the current model (see variants.py)")
+    parser.add_argument("--poll", type=float, default=5.0, help="Seconds between registry checks")
+    args = parser.parse_args()
+    asyncio.run(serve(args.socket, engine=args.engine, variant=args.variant, poll_interval=args.poll))
@@ -1,4 +1,5 @@
-import joblib
+import os
+
 import numpy as np
 import openmeteo_requests
 import requests_cache
@@ -8,6 +9,10 @@ from pydantic import BaseModel
 from retry_requests import retry
 from typing import List
 
+from registry import load_artifacts
+from features import UnknownSoilType
+from gridded_archive import GriddedArchive, OutsideArchive
+
 app = FastAPI()
 
 # Enable CORS for your frontend
@@ -23,12 +28,12 @@ cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
 retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
 openmeteo = openmeteo_requests.Client(session=retry_session)
 
+# AGRIGRAUD_WEATHER_PROVIDER=archive answers from the offline gridded archive, no internet needed
+archive = GriddedArchive.load() if os.environ.get("AGRIGRAUD_WEATHER_PROVIDER") == "archive" else None
+
 # Load Model and Encoders
 try:
-    model = joblib.load('crop_model.pkl')
-    soil_le = joblib.load('soil_encoder.pkl')
-    label_le = joblib.load('label_encoder.pkl')
-    mlb = joblib.load('water_source_mlb.pkl')
+    model, encoder = load_artifacts()
 except Exception as e:
     print(f"Error loading model files: {e}")
 
@@ -43,6 +48,9 @@ class PredictionRequest(BaseModel):
     lng: float
 
 def fetch_weather_data(lat, lng):
+    if archive is not None:
+        return archive.features(lat, lng)
+
     print(f"--- Fetching data for Lat: {lat}, Lng: {lng} ---")
     
     # 1. Weather Data (Forecast & Past)
@@ -102,51 +110,26 @@ async def predict_crop(req: PredictionRequest):
         # 1. Fetch Automated Data
         env_data = fetch_weather_data(req.lat, req.lng)
 
-        # 2. Encoding Soil Type
-        soil_match = next((s for s in soil_le.classes_ if s.lower().strip() == req.soil_type.lower().strip()), None)
-        if soil_match is None:
-            raise HTTPException(status_code=400, detail=f"Soil type {req.soil_type} not found")
-        soil_encoded = soil_le.transform([soil_match])[0]
-
-        # 3. Encoding Water Sources (bore, canals, rainfall)
-        allowed_sources = ['bore', 'canals', 'rainfall']
-        user_sources = [s.lower().strip() for s in req.water_sources if s.lower().strip() in allowed_sources]
-        ws_encoded = mlb.transform([user_sources])
-
-        # 4. Assemble ALL features (Ensure order matches your training data exactly)
-        # Base (5) + Weather/Soil (8) + Water Source Binary (3) = 16 features
-        base_inputs = [
-            req.n, req.p, req.k, req.ph, soil_encoded,
-            env_data["past_temp"], env_data["future_temp"],
-            env_data["past_rain"], env_data["hum"], env_data["future_prob"],
-            env_data["sm1"], env_data["sm2"], env_data["sm3"]
-        ]
-        
-        # This creates the variable that was missing!
-        final_features = np.array(base_inputs + ws_encoded[0].tolist()).reshape(1, -1)
+        # 2-4. Encode soil type and water sources (bore, canals, rainfall) and
+        # assemble ALL features in training order: Base (5) + Weather/Soil (8) + Water Source Binary (3)
+        final_features = encoder.encode(req.n, req.p, req.k, req.ph, req.soil_type, env_data, req.water_sources)
 
         # 5. Predict
         probs = model.predict_proba(final_features)[0]
-        
-        # 6. Prepare JSON response (Converting numpy float to python float)
-        results = []
-        for i, p in enumerate(probs):
-            crop_name = label_le.inverse_transform([i])[0]
-            results.append({
-                "crop": str(crop_name), 
-                "confidence": round(float(p) * 100, 2)
-            })
-        
-        results.sort(key=lambda x: x["confidence"], reverse=True)
+
+        # 6. Prepare JSON response (top 3 crops as plain python types)
+        results = encoder.top_k(probs, 3)
 
         # 7. Clean up weather data types for JSON
         serializable_weather = {k: float(v) for k, v in env_data.items()}
 
         return {
-            "top_crops": results[:3], 
+            "top_crops": results,
             "retrieved_weather": serializable_weather
         }
 
+    except (UnknownSoilType, OutsideArchive) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Prediction Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
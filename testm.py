@@ -1,45 +1,20 @@
-import pandas as pd
-import joblib
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 
-# 1. Load Dataset
-df = pd.read_csv('Hackathon_Training_Data_Final.csv')
+from dataset import load_split
+from registry import load_artifacts
 
-# 2. Load Encoders
-soil_le = joblib.load('soil_encoder.pkl')
-label_le = joblib.load('label_encoder.pkl')
-mlb = joblib.load('water_source_mlb.pkl')
+# 1-2. Load Model and Encoders (model bundle, or the pickles if there is none)
+model, encoder = load_artifacts()
 
-# 3. Process water_source
-df['ws_list'] = df['water_source'].apply(lambda x: [s.strip() for s in x.split(',')])
-ws_encoded = mlb.transform(df['ws_list'])
-ws_df = pd.DataFrame(ws_encoded, columns=mlb.classes_)
+# 3-6. Encoded dataset in training column order (memory-mapped cache, CSV only when it changed),
+# on the cached split the model was trained on, extended rather than redrawn by update.py
+X_train, X_test, y_train, y_test = load_split(encoder, test_size=0.2, seed=42)
 
-df = pd.concat([df.drop(['water_source', 'ws_list'], axis=1), ws_df], axis=1)
-
-# 4. Encode soil_type
-df['soil_type'] = soil_le.transform(df['soil_type'])
-
-# 5. Encode labels
-df['label'] = label_le.transform(df['label'])
-
-# 6. Split again (same random_state for consistency)
-X = df.drop('label', axis=1)
-y = df['label']
-
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42
-)
-
-# 7. Load Model
-model = joblib.load('crop_model.pkl')
-
-# 8. Predictions
+# 7. Predictions
 y_train_pred = model.predict(X_train)
 y_test_pred = model.predict(X_test)
 
-# 9. Accuracy
+# 8. Accuracy
 train_acc = accuracy_score(y_train, y_train_pred)
 test_acc = accuracy_score(y_test, y_test_pred)
 
@@ -48,7 +23,7 @@ print(f"Training Accuracy: {train_acc*100:.2f}%")
 print(f"Test Accuracy:     {test_acc*100:.2f}%")
 print("==============================")
 
-# 10. Overfitting Check
+# 9. Overfitting Check
 gap = train_acc - test_acc
 print(f"Generalization Gap: {gap*100:.2f}%")
 
@@ -57,6 +32,6 @@ if gap > 0.05:
 else:
     print("✅ Model Generalizes Well")
 
-# 11. Classification Report
+# 10. Classification Report
 print("\nClassification Report (Test Data):")
 print(classification_report(y_test, y_test_pred))
\ No newline at end of file
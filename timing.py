@@ -0,0 +1,36 @@
+"""Latency helpers shared by benchmark.py and evaluate.py, without the load-test dependencies"""
+import subprocess
+import time
+
+import numpy as np
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50_ms": p50 * 1000, "p95_ms": p95 * 1000, "p99_ms": p99 * 1000,
+            "mean_ms": float(np.mean(values)) * 1000, "max_ms": max(values) * 1000}
+
+
+def time_batches(bundle, X, batch_sizes, min_time=0.5):
+    """predict_proba latency per call and rows/s for each batch size, on the first rows of X"""
+    bundle.predict_proba(X[:1])
+    results = []
+    for size in batch_sizes:
+        times = []
+        stop = time.perf_counter() + min_time
+        while time.perf_counter() < stop or len(times) < 5:
+            start = time.perf_counter()
+            bundle.predict_proba(X[:size])
+            times.append(time.perf_counter() - start)
+        results.append({"batch_size": size, "calls": len(times), "latency": percentiles(times),
+                        "rows_per_second": size / float(np.median(times))})
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
@@ -1,47 +1,182 @@
+"""Training pipeline: encode the dataset, optionally search hyperparameters, fit, export and publish
+
+    python train.py                                   # 100 trees on every core, as before
+    python train.py --trees 200 --max-depth 20 --n-jobs 4
+    python train.py --search --cv 5 --search-trees 50 100 200 --search-depth none 10 20
+
+Every phase is timed and the run ends with a wall-clock and peak-memory report.
+"""
+import argparse
+import contextlib
+import resource
+import time
+
+import joblib
 import pandas as pd
-from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder, MultiLabelBinarizer
-import joblib
+from sklearn.model_selection import GridSearchCV
+
+from dataset import DATA_PATH, DATASET_DIR, load_dataset
+from registry import publish
+from variants import VARIANTS, build_variants, print_report, save_report, variant_report
+
+PICKLES = ("crop_model.pkl", "soil_encoder.pkl", "label_encoder.pkl", "water_source_mlb.pkl")
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class PhaseReport:
+    """Wall-clock time and process peak memory of each named phase of a run
+
+    Memory is the peak resident set size, so it includes native allocations (sklearn
+    builds trees outside Python's allocator) at no cost to the run. The peak only ever
+    grows: a phase that adds nothing to it stayed below an earlier phase's peak.
+    """
+
+    def __init__(self):
+        self.phases = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        before = peak_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            after = peak_rss_mb()
+            self.phases.append((name, time.perf_counter() - start, after, after - before))
+
+    def print(self):
+        print(f"\n{'PHASE':<16} | {'WALL (s)':>9} | {'PEAK RSS (MB)':>13} | {'GROWTH (MB)':>11}")
+        print("-" * 59)
+        for name, seconds, peak, growth in self.phases:
+            print(f"{name:<16} | {seconds:9.2f} | {peak:13.1f} | {growth:11.1f}")
+        print("-" * 59)
+        print(f"{'total':<16} | {sum(p[1] for p in self.phases):9.2f} | {peak_rss_mb():13.1f} |")
+
+
+def make_forest(trees=100, max_depth=None, min_samples_leaf=1, n_jobs=-1, seed=42):
+    return RandomForestClassifier(n_estimators=trees, max_depth=max_depth, min_samples_leaf=min_samples_leaf,
+                                  n_jobs=n_jobs, random_state=seed)
+
+
+def search(X, y, grid, cv=5, n_jobs=-1, seed=42):
+    """Cross-validated grid search; returns (best params, results table sorted by rank)
+
+    Candidates and folds run in parallel, each forest single-threaded so the two levels
+    of parallelism do not oversubscribe the cores.
+    """
+    searcher = GridSearchCV(make_forest(n_jobs=1, seed=seed), grid, cv=cv, n_jobs=n_jobs, refit=False)
+    searcher.fit(X, y)
+    results = pd.DataFrame(searcher.cv_results_)
+    columns = [f"param_{name}" for name in grid] + ["mean_test_score", "std_test_score", "mean_fit_time"]
+    return searcher.best_params_, results.sort_values("rank_test_score")[columns]
+
+
+def depth(value):
+    return None if value.lower() == "none" else int(value)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the crop recommendation model")
+    parser.add_argument("--data", default=DATA_PATH, help="Training CSV")
+    parser.add_argument("--dataset-cache", default=DATASET_DIR, help="Encoded dataset cache (see dataset.py)")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Cores for fitting and search (-1 = all)")
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--max-depth", type=depth, default=None, help="Tree depth limit, or 'none'")
+    parser.add_argument("--min-samples-leaf", type=int, default=1)
+    parser.add_argument("--search", action="store_true",
+                        help="Pick trees, depth and leaf size by cross-validation on the training split")
+    parser.add_argument("--cv", type=int, default=5, help="Folds for --search")
+    parser.add_argument("--search-trees", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--search-depth", type=depth, nargs="+", default=[None, 10, 20])
+    parser.add_argument("--search-leaf", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--variants", nargs="*", default=None, choices=list(VARIANTS), metavar="NAME",
+                        help=f"Also publish smaller/faster variants (no names = all of {', '.join(VARIANTS)})")
+    parser.add_argument("--no-publish", action="store_true", help="Only write the pickles")
+    args = parser.parse_args(argv)
+    if args.variants is not None and args.no_publish:
+        parser.error("--variants are written to the registry, so they need publishing")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = PhaseReport()
+
+    # Step 1-2: Load the encoded dataset (memory-mapped cache, rebuilt from the CSV when it changed)
+    with report.phase("load"):
+        dataset = load_dataset(args.data, args.dataset_cache)
+        X, y = dataset.frame(), dataset.y
+        soil_le, mlb, label_le = dataset.encoders()
+
+    # Step 3: Train/test split (the same rows train_test_split picks, cached with the dataset)
+    with report.phase("split"):
+        train, test = dataset.split(args.test_size, args.seed)
+        X_train, X_test, y_train, y_test = X.iloc[train], X.iloc[test], y[train], y[test]
 
-# 1. Load the corrected dataset
-df = pd.read_csv('Hackathon_Training_Data_Final.csv')
+    # Step 4: Optional hyperparameter search on the training split only
+    params = {"n_estimators": args.trees, "max_depth": args.max_depth, "min_samples_leaf": args.min_samples_leaf}
+    if args.search:
+        grid = {"n_estimators": args.search_trees, "max_depth": args.search_depth,
+                "min_samples_leaf": args.search_leaf}
+        with report.phase("search"):
+            params, results = search(X_train, y_train, grid, args.cv, args.n_jobs, args.seed)
+        print(f"\nCross-validation ({args.cv} folds), best first:")
+        print(results.head(10).to_string(index=False))
+        print(f"Selected: {params}")
 
-# 2. Handle Multi-Value 'water_source' (Bore, Canal, Rainfall)
-# Convert string "bore, rainfall" -> list ["bore", "rainfall"]
-df['ws_list'] = df['water_source'].apply(lambda x: [s.strip() for s in x.split(',')])
-mlb = MultiLabelBinarizer()
-ws_encoded = mlb.fit_transform(df['ws_list'])
-ws_df = pd.DataFrame(ws_encoded, columns=mlb.classes_)
+    # Step 5: Fit the Random Forest on every core
+    with report.phase("fit"):
+        model = make_forest(params["n_estimators"], params["max_depth"], params["min_samples_leaf"],
+                            args.n_jobs, args.seed)
+        model.fit(X_train, y_train)
 
-# Merge binary columns and drop the original source column
-df = pd.concat([df.drop(['water_source', 'ws_list'], axis=1), ws_df], axis=1)
+    with report.phase("score"):
+        accuracy = model.score(X_test, y_test)
 
-# 3. Encode categorical Soil Type
-soil_le = LabelEncoder()
-df['soil_type'] = soil_le.fit_transform(df['soil_type'])
+    # Step 6: Optional variants: fewer trees, capped depth, pruned, compact float32
+    variants = None
+    if args.variants is not None:
+        with report.phase("variants"):
+            variants = build_variants(model, X_train, y_train, args.variants or list(VARIANTS))
 
-# 4. Encode Target Labels (Crops)
-label_le = LabelEncoder()
-df['label'] = label_le.fit_transform(df['label'])
+    # Step 7: Export model weights and encoders. Serving scores small batches, where
+    # spreading 100 trees over threads costs more than it saves
+    for served in [model] + [variant for variant, _ in (variants or {}).values()]:
+        served.set_params(n_jobs=1)
+    with report.phase("export"):
+        for artifact, name in zip((model, soil_le, label_le, mlb), PICKLES):
+            joblib.dump(artifact, name)
 
-# 5. Define Features (X) and Target (y)
-# Ensure 'label' is not in features
-X = df.drop('label', axis=1)
-y = df['label']
+    # Step 8: Publish a versioned, memory-mappable bundle (and its variants) to the model registry
+    # and make it current (a running API swaps to it without a restart)
+    manifest = None
+    if not args.no_publish:
+        with report.phase("publish"):
+            manifest = publish(model, soil_le, mlb, label_le, variants=variants)
 
-# 6. Train/Test Split
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    # Step 9: Pareto report of the variants on the held-out split
+    if variants:
+        with report.phase("pareto"):
+            rows = variant_report(manifest["version"], list(variants), csv_path=args.data,
+                                  cache=args.dataset_cache, test_size=args.test_size, seed=args.seed)
 
-# 7. Train the Model (Random Forest)
-model = RandomForestClassifier(n_estimators=100, random_state=42)
-model.fit(X_train, y_train)
+    print(f"\nSuccess! Accuracy: {accuracy*100:.2f}%")
+    print(f"Exported: {', '.join(PICKLES)}")
+    if manifest is not None:
+        print(f"Published model version {manifest['version']} to the registry")
+    if variants:
+        print_report(rows)
+        print(f"Variant report written to {save_report(rows)}")
+    report.print()
+    return model
 
-# 8. Export Model Weights and Encoders
-joblib.dump(model, 'crop_model.pkl')
-joblib.dump(soil_le, 'soil_encoder.pkl')
-joblib.dump(label_le, 'label_encoder.pkl')
-joblib.dump(mlb, 'water_source_mlb.pkl')
 
-print(f"Success! Accuracy: {model.score(X_test, y_test)*100:.2f}%")
-print("Exported: crop_model.pkl, soil_encoder.pkl, label_encoder.pkl, water_source_mlb.pkl")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
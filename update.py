@@ -0,0 +1,153 @@
+"""Incremental model update from newly labelled field observations
+
+    python update.py new_outcomes.csv                      # +10 trees, at most 150
+    python update.py new_outcomes.csv --trees 20 --max-trees 120 --activate
+
+Instead of refitting the whole forest:
+    1. the new rows are appended to the training CSV and to the encoded dataset
+       cache; a share of them joins the holdout, earlier rows keep their side
+    2. --trees new trees are fitted (warm_start) on the most recent --window training
+       rows, topped up with a few rows of any crop the window lacks
+    3. the oldest trees are retired once the forest exceeds --max-trees
+    4. the updated and the current model are scored on the holdout
+    5. the current version's variants (variants.py) are rebuilt from the updated forest
+The result is published to the registry as a new version with its parent recorded;
+it becomes current only with --activate and when it is not worse than
+--max-accuracy-drop on the holdout.
+"""
+import argparse
+import copy
+
+import numpy as np
+import pandas as pd
+
+from dataset import DATA_PATH, DATASET_DIR, csv_hash, load_dataset
+from features import FeatureEncoder
+from registry import list_variants, load_model, publish
+from train import PhaseReport
+from variants import VARIANTS, build_variants
+
+
+def append_rows(new_path, csv_path=DATA_PATH, cache=DATASET_DIR):
+    """Appends a CSV of labelled rows to the training CSV and the dataset cache; returns (dataset, rows added)"""
+    dataset = load_dataset(csv_path, cache)
+    new = pd.read_csv(new_path)
+    soil_le, mlb, label_le = dataset.encoders()
+    encoder = FeatureEncoder(soil_le.classes_, mlb.classes_, label_le.classes_)
+    unknown = sorted(set(new["label"]) - set(label_le.classes_))
+    if unknown:
+        # Trees cannot grow extra class outputs, so new crops need a full retrain
+        raise ValueError(f"Unknown crops {', '.join(unknown)}: run train.py to retrain from scratch")
+    X = encoder.encode_frame(new)[dataset.columns]
+    y = encoder.encode_labels(new["label"])
+
+    header = pd.read_csv(csv_path, nrows=0).columns
+    with open(csv_path, "rb+") as f:
+        f.seek(-1, 2)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+    new[header].to_csv(csv_path, mode="a", header=False, index=False)
+    return dataset.append(X.to_numpy(), y, csv_hash(csv_path)), len(new)
+
+
+def recent_rows(train, y, window, per_missing_class=5):
+    """The last window training rows, plus the latest rows of every class they miss"""
+    train = np.sort(train)
+    recent = train[-window:]
+    older = train[:-window] if len(train) > window else train[:0]
+    missing = np.setdiff1d(np.unique(y[train]), np.unique(y[recent]))
+    extra = [older[y[older] == c][-per_missing_class:] for c in missing]
+    return np.concatenate([recent] + extra)
+
+
+def grow_forest(model, X, y, trees, max_trees, n_jobs=-1):
+    """A copy of model with trees new trees fitted on (X, y) and the oldest retired past max_trees"""
+    updated = copy.deepcopy(model)
+    updated.set_params(warm_start=True, n_estimators=len(model.estimators_) + trees, n_jobs=n_jobs)
+    updated.fit(X, y)
+    retired = max(len(updated.estimators_) - max_trees, 0)
+    # warm_start appends, so the oldest trees come first
+    updated.estimators_ = updated.estimators_[retired:]
+    updated.set_params(warm_start=False, n_estimators=len(updated.estimators_), n_jobs=1)
+    return updated, retired
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update the current model with new labelled rows")
+    parser.add_argument("new_rows", help="CSV in the training format (with water_source and label)")
+    parser.add_argument("--data", default=DATA_PATH, help="Training CSV to append to")
+    parser.add_argument("--dataset-cache", default=DATASET_DIR)
+    parser.add_argument("--trees", type=int, default=10, help="New trees to fit")
+    parser.add_argument("--max-trees", type=int, default=150, help="Retire the oldest trees beyond this")
+    parser.add_argument("--window", type=int, default=1000, help="Most recent training rows the new trees see")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.01, help="Allowed holdout accuracy drop (0-1)")
+    parser.add_argument("--activate", action="store_true", help="Make the update current if it validates")
+    args = parser.parse_args(argv)
+    report = PhaseReport()
+
+    # Step 1: Load the model being served (sklearn estimator, the forest grows in sklearn)
+    with report.phase("load"):
+        current = load_model(engine="sklearn")
+        dataset = load_dataset(args.data, args.dataset_cache)
+        if not dataset.matches(current.encoder):
+            raise ValueError(f"Model {current.version} was trained on other classes than {args.data}; retrain it")
+        # Deployments serving a variant (AGRIGRAUD_MODEL_VARIANT) only follow an update that has it too
+        variant_names = list_variants(current.version) if current.path is not None else []
+        unknown = [name for name in variant_names if name not in VARIANTS]
+        if unknown:
+            raise ValueError(f"Model {current.version} has variants {', '.join(unknown)} that update.py cannot "
+                             f"rebuild; retrain with train.py --variants")
+        dataset.split(args.test_size, args.seed)  # Cached before the append so it is extended, not redrawn
+
+    # Step 2: Append the new rows to the CSV and the dataset cache
+    with report.phase("append"):
+        dataset, added = append_rows(args.new_rows, args.data, args.dataset_cache)
+        train, test = dataset.split(args.test_size, args.seed)
+        X, y = dataset.frame(), np.asarray(dataset.y)
+
+    # Step 3: Fit new trees on recent data and retire the oldest
+    with report.phase("fit"):
+        recent = recent_rows(train, y, args.window)
+        model, retired = grow_forest(current.model, X.iloc[recent], y[recent], args.trees, args.max_trees,
+                                     args.n_jobs)
+
+    # Step 4: Re-validate both models on the holdout
+    with report.phase("validate"):
+        before = current.model.score(X.iloc[test], y[test])
+        after = model.score(X.iloc[test], y[test])
+    passed = before - after <= args.max_accuracy_drop
+
+    # Step 5: Rebuild the current version's variants from the updated forest
+    variants = None
+    if variant_names:
+        with report.phase("variants"):
+            variants = build_variants(model, X.iloc[train], y[train], variant_names)
+            for variant, _ in variants.values():
+                variant.set_params(n_jobs=1)
+
+    # Step 6: Publish a registry-ready version; activate only if asked and validated
+    with report.phase("publish"):
+        lineage = {"parent": current.version, "rows_added": added, "rows": dataset.manifest["rows"],
+                   "trees_added": args.trees, "trees_retired": retired, "holdout_accuracy": after,
+                   "parent_holdout_accuracy": before}
+        manifest = publish(model, *dataset.encoders(), make_current=args.activate and passed, variants=variants,
+                           lineage=lineage)
+
+    print(f"\nAppended {added} rows ({dataset.manifest['rows']} total), fitted {args.trees} trees on "
+          f"{len(recent)} recent rows, retired {retired} ({len(model.estimators_)} trees)")
+    print(f"Holdout accuracy ({len(test)} rows): {before * 100:.2f}% -> {after * 100:.2f}%")
+    if variants:
+        print(f"Rebuilt variants: {', '.join(variants)}")
+    if not passed:
+        print(f"Validation FAILED: accuracy dropped more than {args.max_accuracy_drop * 100:.2f} points")
+    state = "current" if args.activate and passed else "not activated; use registry.py activate"
+    print(f"Published model version {manifest['version']} ({state})")
+    report.print()
+    return manifest
+
+
+if __name__ == "__main__":
+    main()
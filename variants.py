@@ -0,0 +1,132 @@
+"""Smaller and faster variants of a trained forest, and their accuracy/cost Pareto report
+
+For the IVR and low-end server tiers, which trade a little accuracy for latency and
+memory. train.py --variants writes them next to the full model in the registry
+(models/<version>/variants/<name>/) and a deployment serves one by name with
+AGRIGRAUD_MODEL_VARIANT.
+
+    python train.py --variants                    # all of VARIANTS
+    python train.py --variants pruned compact
+    python variants.py report [--version V]       # re-measure a published version
+"""
+import argparse
+import copy
+import json
+import os
+
+from sklearn.base import clone
+
+from dataset import DATA_PATH, DATASET_DIR
+from evaluate import evaluate
+from registry import current_version, list_variants, version_path
+
+VARIANTS = {
+    # name: spec. trees alone keeps the first trees of the trained forest; max_depth or
+    # ccp_alpha (cost-complexity pruning) refit it; compact stores the float32 forest
+    "trees50": {"trees": 50},
+    "trees20": {"trees": 20},
+    "depth12": {"max_depth": 12},
+    "depth8": {"max_depth": 8},
+    "pruned": {"ccp_alpha": 0.002},
+    "compact": {"compact": True},
+    "pruned_compact": {"ccp_alpha": 0.002, "compact": True},
+    "tiny": {"trees": 20, "ccp_alpha": 0.005, "compact": True},
+}
+# Objectives of the Pareto front: maximize the first, minimize the rest
+OBJECTIVES = ("accuracy", "latency_ms", "memory_bytes", "size_bytes")
+
+
+def first_trees(model, trees):
+    """The forest cut down to its first trees, without refitting"""
+    small = copy.copy(model)
+    small.estimators_ = model.estimators_[:trees]
+    small.n_estimators = trees
+    return small
+
+
+def make_variant(model, X, y, trees=None, max_depth=None, ccp_alpha=None, compact=False):
+    """(sklearn model, compact) for one variant spec"""
+    if max_depth is None and ccp_alpha is None:
+        return (first_trees(model, trees) if trees else model), compact
+    params = {"max_depth": max_depth, "ccp_alpha": ccp_alpha or 0.0}
+    if trees:
+        params["n_estimators"] = trees
+    return clone(model).set_params(**params).fit(X, y), compact
+
+
+def build_variants(model, X, y, names):
+    """{name: (model, compact)} for publish(variants=...), fitted on the training split"""
+    return {name: make_variant(model, X, y, **VARIANTS[name]) for name in names}
+
+
+def pareto_front(rows):
+    """Marks each row with pareto=True unless another is at least as good on every objective"""
+    def costs(row):
+        return (-row["accuracy"],) + tuple(row[key] for key in OBJECTIVES[1:])
+
+    for row in rows:
+        mine = costs(row)
+        row["pareto"] = not any(
+            all(a <= b for a, b in zip(costs(other), mine)) and costs(other) != mine for other in rows)
+    return rows
+
+
+def variant_report(version=None, names=None, directory=".", min_time=0.3, csv_path=DATA_PATH, cache=DATASET_DIR,
+                   test_size=0.2, seed=42):
+    """Held-out accuracy, single-row latency, memory and size of a version and its variants
+
+    csv_path, cache, test_size and seed must be the ones the version was trained with,
+    or the "held-out" rows include training rows.
+    """
+    version = version or current_version(directory)
+    names = list_variants(version, directory) if names is None else names
+    rows = []
+    for name in ["full"] + list(names):
+        bundle_path = version_path(version, directory, variant=None if name == "full" else name)
+        report = evaluate(bundle_path, "flat", csv_path, cache, test_size, seed, batch_sizes=[1, 512],
+                          min_time=min_time)
+        single, batch = report["inference"]
+        rows.append({
+            "variant": name, "version": report["model"]["version"],
+            "accuracy": report["accuracy"]["test"], "macro_f1": report["accuracy"]["macro_f1"],
+            "latency_ms": single["latency"]["p50_ms"], "batch_row_us": 1e6 / batch["rows_per_second"],
+            "memory_bytes": report["size"]["memory_bytes"], "size_bytes": report["size"]["bytes"],
+            "n_trees": report["size"]["n_trees"], "max_depth": report["size"]["max_depth"],
+        })
+    return pareto_front(rows)
+
+
+def print_report(rows):
+    print(f"\n{'VARIANT':<16} | {'ACCURACY':>8} | {'1 ROW (ms)':>10} | {'ROW@512 (us)':>12} | "
+          f"{'MEMORY (MB)':>11} | {'SIZE (MB)':>9} | PARETO")
+    print("-" * 92)
+    for row in rows:
+        print(f"{row['variant']:<16} | {row['accuracy'] * 100:7.2f}% | {row['latency_ms']:10.3f} | "
+              f"{row['batch_row_us']:12.2f} | {row['memory_bytes'] / 2**20:11.2f} | {row['size_bytes'] / 2**20:9.2f} | "
+              f"{'*' if row['pareto'] else ''}")
+
+
+def save_report(rows, out=None):
+    out = out or f"eval_results/{rows[0]['version']}-variants.json"
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(rows, f, indent=2)
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Model variant tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report_cmd = sub.add_parser("report", help="Pareto report of a published version's variants")
+    report_cmd.add_argument("--version", default=None, help="Registry version (default: current)")
+    report_cmd.add_argument("--out", default=None, help="JSON report path")
+    report_cmd.add_argument("--data", default=DATA_PATH, help="Training CSV the version was trained on")
+    report_cmd.add_argument("--dataset-cache", default=DATASET_DIR)
+    report_cmd.add_argument("--test-size", type=float, default=0.2)
+    report_cmd.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rows = variant_report(args.version, csv_path=args.data, cache=args.dataset_cache, test_size=args.test_size,
+                          seed=args.seed)
+    print_report(rows)
+    print(f"Report written to {save_report(rows, args.out)}")
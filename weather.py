@@ -0,0 +1,402 @@
+"""Async Open-Meteo client and weather feature extraction for the prediction API"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import math
+
+import httpx
+
+from cache import SingleFlight, TTLCache
+from metrics import REGISTRY, span
+from weather_features import (SOIL_VARS, WEATHER_VARS, soil_features, soil_features_many, utc_today, weather_features,
+                              weather_features_many)
+
+API_BASE = os.environ.get("AGRIGRAUD_OPENMETEO_URL", "https://api.open-meteo.com/v1")
+FORECAST_URL = f"{API_BASE}/forecast"
+SOIL_URL = f"{API_BASE}/dwd-icon"  # DWD ICON model for high accuracy soil moisture
+
+# Locations per upstream request in bulk fetches; Open-Meteo takes comma-separated coordinates
+BULK_LOCATIONS = int(os.environ.get("AGRIGRAUD_WEATHER_BULK_LOCATIONS", "100"))
+
+# Same statuses retry_requests retries on by default
+RETRY_STATUSES = (500, 502, 504)
+
+
+class ResponseCache:
+    """SQLite store of raw response bodies, the async replacement for requests_cache"""
+
+    def __init__(self, path="weather_cache.sqlite", expire_after=3600):
+        self.expire_after = expire_after
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires REAL, body BLOB)")
+        self._db.execute("DELETE FROM responses WHERE expires < ?", (time.time(),))
+        self._db.commit()
+
+    def _get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT expires, body FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or row[0] < time.time():
+            return None
+        return row[1]
+
+    def _set(self, key, body):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                             (key, time.time() + self.expire_after, body))
+            self._db.commit()
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key, body):
+        await asyncio.to_thread(self._set, key, body)
+
+    def close(self):
+        self._db.close()
+
+
+class AsyncWeatherClient:
+    """Pooled async HTTP client for Open-Meteo with response caching and retry/backoff"""
+
+    def __init__(self, cache=None, retries=5, backoff_factor=0.2, timeout=10.0, max_connections=64):
+        self.cache = cache
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._http = httpx.AsyncClient(timeout=timeout, limits=limits)
+
+        self.upstream_calls = REGISTRY.counter(
+            "agrigraud_upstream_requests_total", "Open-Meteo HTTP attempts by endpoint and outcome")
+        self.retry_count = REGISTRY.counter(
+            "agrigraud_upstream_retries_total", "Open-Meteo attempts that were retried")
+        self.cache_lookups = REGISTRY.counter(
+            "agrigraud_response_cache_total", "SQLite response cache lookups by result")
+
+    async def get(self, url, params, refresh=False):
+        """Returns the decoded JSON body for url/params, served from cache when fresh
+
+        refresh=True always goes upstream and replaces the cached body.
+        """
+        key = str(httpx.URL(url, params=params))
+        body = None
+        if self.cache is not None and not refresh:
+            with span("response_cache"):
+                body = await self.cache.get(key)
+            self.cache_lookups.inc(result="miss" if body is None else "hit")
+        if body is None:
+            with span("upstream"):
+                body = await self._fetch(url, params)
+            if self.cache is not None:
+                await self.cache.set(key, body)
+        with span("decode"):
+            return json.loads(body)
+
+    async def _fetch(self, url, params):
+        endpoint = url.rsplit("/", 1)[-1]
+        for attempt in range(self.retries + 1):
+            last_try = attempt == self.retries
+            if attempt:
+                self.retry_count.inc(endpoint=endpoint)
+            try:
+                response = await self._http.get(url, params=params)
+            except httpx.TransportError:
+                self.upstream_calls.inc(endpoint=endpoint, outcome="transport_error")
+                if last_try:
+                    raise
+            else:
+                self.upstream_calls.inc(endpoint=endpoint, outcome=str(response.status_code))
+                if response.status_code not in RETRY_STATUSES or last_try:
+                    response.raise_for_status()
+                    return response.content
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+    async def aclose(self):
+        await self._http.aclose()
+        if self.cache is not None:
+            self.cache.close()
+
+
+def _coordinate(value):
+    # A list of locations goes upstream as one comma-separated parameter
+    return ",".join(str(v) for v in value) if isinstance(value, (list, tuple)) else value
+
+
+def forecast_params(lat, lng, start=None, end=None):
+    if start is not None:
+        # Only the days from start through end (today), for a weather store that has the rest
+        return {"latitude": _coordinate(lat), "longitude": _coordinate(lng), "hourly": WEATHER_VARS,
+                "start_date": start.isoformat(), "end_date": end.isoformat()}
+    # We use the forecast endpoint with 'past_days' to get recent historical data
+    return {"latitude": _coordinate(lat), "longitude": _coordinate(lng), "hourly": WEATHER_VARS,
+            "past_days": 7, "forecast_days": 1}
+
+
+def soil_params(lat, lng):
+    # Only the first hour is used, so one forecast day instead of the default seven
+    return {"latitude": _coordinate(lat), "longitude": _coordinate(lng), "hourly": SOIL_VARS, "forecast_days": 1}
+
+
+async def fetch_weather_data(client, lat, lng, store=None):
+    """Fetches environmental and soil data from Open-Meteo, both calls in flight at once"""
+    if store is not None:
+        return (await fetch_weather_many(client, [(lat, lng)], store=store))[0]
+    forecast, soil = await asyncio.gather(
+        client.get(FORECAST_URL, forecast_params(lat, lng)),
+        client.get(SOIL_URL, soil_params(lat, lng)),
+    )
+    with span("weather_features"):
+        return {**weather_features(forecast["hourly"]), **soil_features(soil["hourly"])}
+
+
+def _as_list(body):
+    # A single-location request returns one object rather than a list of one
+    return body if isinstance(body, list) else [body]
+
+
+async def fetch_weather_many(client, locations, chunk_size=BULK_LOCATIONS, max_concurrent=8, store=None,
+                             refresh=False, return_exceptions=False):
+    """Weather features for many locations, chunk_size of them per upstream request
+
+    Returns a list of feature dicts in the order of locations. At most max_concurrent
+    chunks are in flight at once, so a large run does not exhaust the connection pool.
+    With return_exceptions, the locations of a failed chunk get its exception instead
+    of failing the whole call, so the other chunks' results are kept.
+    With a weather_store.WeatherStore, locations are grouped by the first day they lack
+    and only the days from there through today are requested.
+    """
+    locations = list(locations)
+    slots = asyncio.Semaphore(max_concurrent)
+    today = utc_today()
+
+    async def fetch_chunk(chunk, start):
+        lats = [lat for lat, _ in chunk]
+        lngs = [lng for _, lng in chunk]
+        async with slots:
+            forecast, soil = await asyncio.gather(
+                client.get(FORECAST_URL, forecast_params(lats, lngs, start, today), refresh),
+                client.get(SOIL_URL, soil_params(lats, lngs), refresh),
+            )
+        forecast, soil = _as_list(forecast), _as_list(soil)
+        if len(forecast) != len(chunk) or len(soil) != len(chunk):
+            raise ValueError(f"Open-Meteo returned {len(forecast)}/{len(soil)} locations for {len(chunk)}")
+        hourlies = [r["hourly"] for r in forecast]
+        with span("weather_features"):
+            if store is None:
+                weather = weather_features_many(hourlies)
+            else:
+                weather = await store.features_many(chunk, start, today, hourlies)
+            return [{**w, **s} for w, s in zip(weather, soil_features_many([r["hourly"] for r in soil]))]
+
+    starts = await store.first_missing_many(locations, today) if store is not None else [None] * len(locations)
+    groups = {}
+    for i, start in enumerate(starts):
+        groups.setdefault(start, []).append(i)
+    chunks = [(indices[j:j + chunk_size], start)
+              for start, indices in groups.items() for j in range(0, len(indices), chunk_size)]
+    results = await asyncio.gather(*(fetch_chunk([locations[i] for i in indices], start) for indices, start in chunks),
+                                   return_exceptions=return_exceptions)
+
+    envs = [None] * len(locations)
+    for (indices, _), chunk_envs in zip(chunks, results):
+        if isinstance(chunk_envs, BaseException):
+            chunk_envs = [chunk_envs] * len(indices)
+        for i, env in zip(indices, chunk_envs):
+            envs[i] = env
+    return envs
+
+
+class OpenMeteoProvider:
+    """Weather provider backed by the Open-Meteo API
+
+    A provider turns grid cells into feature dicts: fetch_many(cells, chunk_size,
+    max_concurrent, refresh) returns them in order, with the exception in place of
+    cells it failed to fetch, and aclose() releases its resources. weather_archive.ArchiveProvider is the offline implementation.
+    """
+
+    def __init__(self, client, store=None):
+        self.client = client
+        self.store = store  # Optional weather_store.WeatherStore of daily rollups per cell
+
+    async def fetch_many(self, cells, chunk_size=BULK_LOCATIONS, max_concurrent=8, refresh=False):
+        return await fetch_weather_many(self.client, cells, chunk_size, max_concurrent, self.store, refresh,
+                                        return_exceptions=True)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def snap_to_grid(lat, lng, grid):
+    """Centre of the grid cell containing (lat, lng), so nearby farms share one cache entry"""
+    return round(round(lat / grid) * grid, 6), round(round(lng / grid) * grid, 6)
+
+
+class WeatherService:
+    """Weather features per grid cell, memoised in memory in front of a weather provider
+
+    Concurrent misses for one cell share a single upstream fetch (and its retries).
+    The *_within lookups give up waiting after a timeout and fall back to the cell's
+    last fetched features, then to the climatology table for the current week.
+    """
+
+    def __init__(self, provider, grid=0.05, ttl=3600, max_cells=10000, climatology=None):
+        self.provider = provider  # OpenMeteoProvider or weather_archive.ArchiveProvider
+        self.climatology = climatology  # Optional climatology.Climatology
+        self.grid = grid
+        self.cache = TTLCache(max_size=max_cells, ttl=ttl)
+        self.last_known = TTLCache(max_size=max_cells, ttl=math.inf)
+        self.inflight = SingleFlight()
+
+    async def get(self, lat, lng):
+        cell = snap_to_grid(lat, lng, self.grid)
+        env = self.cache.get(cell)
+        if env is None:
+            env = await self.inflight.do(cell, lambda: self._fetch(cell))
+        return env
+
+    async def _fetch(self, cell):
+        env = (await self.provider.fetch_many([cell]))[0]
+        if isinstance(env, BaseException):
+            raise env
+        self.cache.set(cell, env)
+        self.last_known.set(cell, env)
+        return env
+
+    def fallback(self, lat, lng):
+        """(features, source) without going upstream, (None, None) when nothing is known"""
+        cell = snap_to_grid(lat, lng, self.grid)
+        env = self.last_known.get(cell)
+        if env is not None:
+            return env, "last_known"
+        if self.climatology is not None:
+            env = self.climatology.lookup(lat, lng, utc_today().isocalendar()[1])
+            if env is not None:
+                return env, "climatology"
+        return None, None
+
+    async def get_within(self, lat, lng, timeout):
+        """(features, source): source is "live", or the fallback used when upstream was too slow or failed
+
+        The upstream fetch keeps running after a timeout, so the cache is filled for the next request.
+        Re-raises the upstream error (or the timeout) when there is no fallback.
+        """
+        cell = snap_to_grid(lat, lng, self.grid)
+        env = self.cache.get(cell)
+        if env is not None:
+            return env, "live"
+        try:
+            return await asyncio.wait_for(self.inflight.do(cell, lambda: self._fetch(cell)), max(timeout, 0.0)), "live"
+        except Exception:
+            env, source = self.fallback(lat, lng)
+            if env is None:
+                raise
+            return env, source
+
+    async def get_many(self, locations, chunk_size=BULK_LOCATIONS):
+        """Features for each (lat, lng); cells not cached are fetched in bulk requests
+
+        Cells another request is already fetching are awaited rather than fetched again.
+        """
+        cells = [snap_to_grid(lat, lng, self.grid) for lat, lng in locations]
+        envs = {}
+        for cell in cells:
+            if cell not in envs:
+                envs[cell] = self.cache.get(cell)
+        missing = [cell for cell, env in envs.items() if env is None]
+        fresh = {cell for cell in missing if not self.inflight.running(cell)}
+        bulk = asyncio.ensure_future(self._fetch_many(list(fresh), chunk_size)) if fresh else None
+
+        async def from_bulk(cell):
+            if cell not in fresh:
+                # Its earlier fetch finished before we could join it
+                return await self._fetch(cell)
+            env = (await asyncio.shield(bulk))[cell]
+            if isinstance(env, BaseException):
+                raise env
+            return env
+
+        # Registering the bulk cells lets concurrent single lookups join this fetch too
+        fetched = await asyncio.gather(*(self.inflight.do(cell, lambda cell=cell: from_bulk(cell)) for cell in missing))
+        envs.update(zip(missing, fetched))
+        return [envs[cell] for cell in cells]
+
+    async def get_many_within(self, locations, timeout):
+        """(features, sources) per location, like get_within for a whole batch"""
+        locations = list(locations)
+        try:
+            envs = await asyncio.wait_for(self.get_many(locations), max(timeout, 0.0))
+            return envs, ["live"] * len(envs)
+        except Exception:
+            envs, sources = [], []
+            for lat, lng in locations:
+                env = self.cache.get(snap_to_grid(lat, lng, self.grid))
+                env, source = (env, "live") if env is not None else self.fallback(lat, lng)
+                if env is None:
+                    raise
+                envs.append(env)
+                sources.append(source)
+            return envs, sources
+
+    async def _fetch_many(self, cells, chunk_size, max_concurrent=8, refresh=False):
+        """{cell: features, or the exception its chunk failed with}; fetched cells are cached"""
+        envs = await self.provider.fetch_many(cells, chunk_size, max_concurrent, refresh)
+        envs = dict(zip(cells, envs))
+        for cell, env in envs.items():
+            if isinstance(env, BaseException):
+                continue
+            self.cache.set(cell, env)
+            self.last_known.set(cell, env)
+        return envs
+
+    async def refresh_many(self, cells, chunk_size=BULK_LOCATIONS, max_concurrent=8):
+        """Refetches cells from upstream, bypassing the response cache, and replaces their entries
+
+        Requests keep being served the previous entry until the new one is in. Returns
+        {cell: exception} for the cells that could not be refetched.
+        """
+        envs = await self._fetch_many(list(cells), chunk_size, max_concurrent, refresh=True)
+        return {cell: env for cell, env in envs.items() if isinstance(env, BaseException)}
+
+    async def aclose(self):
+        await self.provider.aclose()
+
+
+async def _fetch_fields(path, out, grid, chunk_size, store_dir):
+    # Imported here, weather_store itself builds on this module
+    from weather_store import WeatherStore
+
+    with open(path, newline="") as f:
+        fields = list(csv.DictReader(f))
+    client = AsyncWeatherClient(cache=ResponseCache(expire_after=3600))
+    store = WeatherStore(store_dir) if store_dir else None
+    service = WeatherService(OpenMeteoProvider(client, store), grid=grid, max_cells=len(fields) + 1)
+    try:
+        start = time.perf_counter()
+        envs = await service.get_many([(float(r["lat"]), float(r["lng"])) for r in fields], chunk_size)
+        elapsed = time.perf_counter() - start
+    finally:
+        await service.aclose()
+
+    with open(out, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(fields[0]) + list(envs[0]) if fields else [])
+        writer.writeheader()
+        for row, env in zip(fields, envs):
+            writer.writerow({**row, **env})
+    print(f"Weather for {len(fields)} fields ({len(service.cache)} grid cells) in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk weather features for a CSV of fields with lat,lng columns")
+    parser.add_argument("fields", help="CSV with lat and lng columns")
+    parser.add_argument("--out", default="field_weather.csv", help="CSV to write, the input columns plus weather features")
+    parser.add_argument("--grid", type=float, default=0.05, help="Grid cell size in degrees")
+    parser.add_argument("--chunk-size", type=int, default=BULK_LOCATIONS, help="Locations per upstream request")
+    parser.add_argument("--store", default="weather_store", help="Daily rollup store directory, '' to disable")
+    args = parser.parse_args()
+    asyncio.run(_fetch_fields(args.fields, args.out, args.grid, args.chunk_size, args.store))
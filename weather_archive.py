@@ -0,0 +1,146 @@
+"""Offline weather provider backed by a pre-downloaded gridded archive of hourly data
+
+Builds archives (downloaded from Open-Meteo or synthesized) in the layout that
+gridded_archive.GriddedArchive reads. The provider works without internet (field
+deployments, CI) and as a deterministic stand-in for load tests.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+
+from gridded_archive import ARCHIVE_DIR, ARCHIVE_FORMAT, VARIABLES, GriddedArchive, OutsideArchive
+from weather import BULK_LOCATIONS, FORECAST_URL, SOIL_URL, AsyncWeatherClient, forecast_params
+from weather_features import SOIL_VARS, WEATHER_VARS, utc_today
+
+INDIA = ((8.0, 37.0), (68.0, 98.0))  # Default (lat, lng) ranges of the region to download
+
+
+class ArchiveProvider:
+    """Weather provider that answers from a GriddedArchive instead of Open-Meteo
+
+    Cells outside the archive's grid get an OutsideArchive error, not the edge cell's weather.
+    """
+
+    def __init__(self, archive):
+        self.archive = archive
+
+    async def fetch_many(self, cells, chunk_size=BULK_LOCATIONS, max_concurrent=8, refresh=False):
+        inside = [cell for cell in cells if self.archive.contains(*cell)]
+        envs = dict(zip(inside, self.archive.features_many(inside)))
+        return [envs[cell] if cell in envs else OutsideArchive(f"{cell} is outside the weather archive's extent")
+                for cell in cells]
+
+    async def aclose(self):
+        pass
+
+
+def _create(path, lat_range, lng_range, grid, start, days, source):
+    lats = np.arange(lat_range[0], lat_range[1] + grid / 2, grid)
+    lngs = np.arange(lng_range[0], lng_range[1] + grid / 2, grid)
+    os.makedirs(path, exist_ok=True)
+    manifest = {
+        "format": ARCHIVE_FORMAT, "lat0": float(lats[0]), "lng0": float(lngs[0]), "grid": grid,
+        "shape": [len(lats), len(lngs)], "start": start.isoformat(), "days": days,
+        "variables": VARIABLES, "source": source,
+    }
+    arrays = {name: np.lib.format.open_memmap(f"{path}/{name}.npy", mode="w+", dtype=np.float32,
+                                              shape=(len(lats), len(lngs), days * 24))
+              for name in VARIABLES}
+    return manifest, arrays, lats, lngs
+
+
+def _write_manifest(path, manifest, arrays):
+    for array in arrays.values():
+        array.flush()
+    with open(f"{path}/manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+async def download(path=ARCHIVE_DIR, lat_range=INDIA[0], lng_range=INDIA[1], grid=0.25, days=14,
+                   chunk_size=50, max_concurrent=4):
+    """Downloads the last days (through today's forecast) for every grid point from Open-Meteo"""
+    end = utc_today()
+    start = end - datetime.timedelta(days=days - 1)
+    manifest, arrays, lats, lngs = _create(path, lat_range, lng_range, grid, start, days, "open-meteo")
+    points = [(i, j) for i in range(len(lats)) for j in range(len(lngs))]
+    client = AsyncWeatherClient()
+    slots = asyncio.Semaphore(max_concurrent)
+
+    async def fetch_chunk(chunk):
+        chunk_lats = [round(float(lats[i]), 4) for i, _ in chunk]
+        chunk_lngs = [round(float(lngs[j]), 4) for _, j in chunk]
+        soil_params = {"latitude": ",".join(map(str, chunk_lats)), "longitude": ",".join(map(str, chunk_lngs)),
+                       "hourly": SOIL_VARS, "start_date": start.isoformat(), "end_date": end.isoformat()}
+        async with slots:
+            weather, soil = await asyncio.gather(
+                client.get(FORECAST_URL, forecast_params(chunk_lats, chunk_lngs, start, end)),
+                client.get(SOIL_URL, soil_params),
+            )
+        for body, names in ((weather, WEATHER_VARS), (soil, SOIL_VARS)):
+            body = body if isinstance(body, list) else [body]
+            for (i, j), response in zip(chunk, body):
+                for name in names:
+                    arrays[name][i, j] = np.asarray(response["hourly"][name], dtype=np.float64)[:days * 24]
+
+    try:
+        await asyncio.gather(*(fetch_chunk(points[k:k + chunk_size]) for k in range(0, len(points), chunk_size)))
+    finally:
+        await client.aclose()
+    _write_manifest(path, manifest, arrays)
+    return manifest
+
+
+def synthesize(path=ARCHIVE_DIR, lat_range=INDIA[0], lng_range=INDIA[1], grid=0.25, days=14, seed=0):
+    """Writes a plausible random archive, for CI and load tests where nothing can be downloaded"""
+    start = utc_today() - datetime.timedelta(days=days - 1)
+    manifest, arrays, lats, lngs = _create(path, lat_range, lng_range, grid, start, days, "synthetic")
+    rng = np.random.default_rng(seed)
+    shape = arrays["temperature_2m"].shape
+    diurnal = np.sin(np.arange(shape[2]) * 2 * np.pi / 24)
+    base = 32 - 0.4 * (lats[:, None, None] - lats[0]) + rng.normal(0, 1, shape[:2] + (1,))
+    arrays["temperature_2m"][:] = base + 5 * diurnal + rng.normal(0, 1, shape)
+    wet = rng.random(shape) < 0.1
+    arrays["precipitation"][:] = np.where(wet, rng.exponential(2.0, shape), 0.0)
+    arrays["relative_humidity_2m"][:] = np.clip(65 - 15 * diurnal + rng.normal(0, 8, shape), 5, 100)
+    arrays["precipitation_probability"][:] = np.clip(np.where(wet, 70, 10) + rng.normal(0, 10, shape), 0, 100)
+    for depth, name in enumerate(SOIL_VARS):
+        arrays[name][:] = np.clip(0.2 + 0.05 * depth + rng.normal(0, 0.03, shape), 0.0, 0.6)
+    _write_manifest(path, manifest, arrays)
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline gridded weather archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="Download (or synthesize) an archive")
+    build_cmd.add_argument("--out", default=ARCHIVE_DIR)
+    build_cmd.add_argument("--lat", type=float, nargs=2, default=INDIA[0], metavar=("MIN", "MAX"))
+    build_cmd.add_argument("--lng", type=float, nargs=2, default=INDIA[1], metavar=("MIN", "MAX"))
+    build_cmd.add_argument("--grid", type=float, default=0.25, help="Grid step in degrees")
+    build_cmd.add_argument("--days", type=int, default=14, help="Days to keep, ending with today's forecast")
+    build_cmd.add_argument("--synthetic", action="store_true", help="Random data instead of downloading")
+    lookup_cmd = sub.add_parser("lookup", help="Print the features for a location and the lookup time")
+    lookup_cmd.add_argument("lat", type=float)
+    lookup_cmd.add_argument("lng", type=float)
+    lookup_cmd.add_argument("--archive", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if args.synthetic:
+            manifest = synthesize(args.out, args.lat, args.lng, args.grid, args.days)
+        else:
+            manifest = asyncio.run(download(args.out, args.lat, args.lng, args.grid, args.days))
+        print(f"Wrote {manifest['shape'][0]}x{manifest['shape'][1]} grid, {manifest['days']} days to {args.out}/")
+    else:
+        archive = GriddedArchive.load(args.archive)
+        archive.features(args.lat, args.lng)
+        start = time.perf_counter()
+        for _ in range(1000):
+            env = archive.features(args.lat, args.lng)
+        print(json.dumps(env, indent=2))
+        print(f"Lookup: {(time.perf_counter() - start) * 1000:.1f} us")
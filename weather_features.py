@@ -0,0 +1,57 @@
+"""Weather feature math shared by the live client, the store and the offline archive
+
+Only NumPy: the offline archive reader uses it without the HTTP client.
+"""
+import datetime
+
+import numpy as np
+
+WEATHER_VARS = ["temperature_2m", "precipitation", "relative_humidity_2m", "precipitation_probability"]
+SOIL_VARS = ["soil_moisture_0_to_1cm", "soil_moisture_1_to_3cm", "soil_moisture_3_to_9cm"]
+PAST_HOURS = 168  # Last 7 days, the remaining 24 hours are the forecast
+
+
+def utc_today():
+    # Open-Meteo days are GMT unless a timezone is requested
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def hourly_array(hourly, name):
+    # Open-Meteo sends null for missing hours, which float arrays turn into nan
+    return np.asarray(hourly[name], dtype=np.float64)
+
+
+def hourly_matrix(hourlies, name):
+    """(locations, hours) array of one variable across several responses"""
+    return np.array([hourly[name] for hourly in hourlies], dtype=np.float64)
+
+
+def weather_features_many(hourlies):
+    """Aggregates the 7 past days and the next 24h for every location at once"""
+    temp = hourly_matrix(hourlies, "temperature_2m")
+    precip = hourly_matrix(hourlies, "precipitation")
+    hum = hourly_matrix(hourlies, "relative_humidity_2m")
+    prob = hourly_matrix(hourlies, "precipitation_probability")
+    columns = {
+        "past_temp": np.mean(temp[:, :PAST_HOURS], axis=1),
+        "future_temp": np.mean(temp[:, PAST_HOURS:], axis=1),
+        "past_rain": np.sum(precip[:, :PAST_HOURS], axis=1),
+        "hum": np.mean(hum, axis=1),
+        "future_prob": np.max(prob[:, PAST_HOURS:], axis=1) / 100.0,  # Max prob next 24h
+    }
+    return [{name: float(values[i]) for name, values in columns.items()} for i in range(len(hourlies))]
+
+
+def soil_features_many(hourlies):
+    # First hour of each returned series
+    columns = {f"sm{i + 1}": hourly_matrix(hourlies, name)[:, 0] for i, name in enumerate(SOIL_VARS)}
+    return [{name: float(values[i]) for name, values in columns.items()} for i in range(len(hourlies))]
+
+
+def weather_features(hourly):
+    """Aggregates the 7 past days and the next 24h into the model's weather inputs"""
+    return weather_features_many([hourly])[0]
+
+
+def soil_features(hourly):
+    return soil_features_many([hourly])[0]
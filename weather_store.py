@@ -0,0 +1,100 @@
+"""Per-cell store of daily weather rollups, so a refresh only downloads the hours it lacks
+
+Each grid cell is one small .npy file, memory-mapped on access, holding a ring of
+RING_DAYS rows: the UTC day ordinal, then that day's sums of hourly temperature,
+precipitation and relative humidity. Past days never change upstream, so once a day
+is stored only today's 24 hours (and any days the cell has not seen yet) are fetched.
+The file I/O runs in a worker thread, off the event loop.
+"""
+import asyncio
+import datetime
+import os
+import threading
+
+import numpy as np
+
+from weather_features import PAST_HOURS, hourly_matrix
+
+STORE_DIR = "weather_store"
+PAST_DAYS = PAST_HOURS // 24
+RING_DAYS = PAST_DAYS + 1
+DAY, TEMP, PRECIP, HUM = range(4)
+
+
+class WeatherStore:
+    """Daily temperature, precipitation and humidity sums per grid cell"""
+
+    def __init__(self, path=STORE_DIR):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()  # One writer at a time per store
+        self.days_fetched = 0
+        self.days_reused = 0
+
+    def _file(self, cell):
+        return os.path.join(self.path, f"{cell[0]:.6f}_{cell[1]:.6f}.npy")
+
+    def _open(self, cell, create=False):
+        path = self._file(cell)
+        if os.path.exists(path):
+            return np.load(path, mmap_mode="r+")
+        if not create:
+            return None
+        rows = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(RING_DAYS, 4))
+        rows[:, DAY] = -1
+        return rows
+
+    def _first_missing(self, cell, today):
+        rows = self._open(cell)
+        stored = set() if rows is None else set(rows[:, DAY].astype(int).tolist())
+        for offset in range(PAST_DAYS, 0, -1):
+            day = today - datetime.timedelta(days=offset)
+            if day.toordinal() not in stored:
+                return day
+        return today
+
+    async def first_missing_many(self, cells, today):
+        """Earliest past day each cell has no rollup for (today when all are stored), in one worker thread"""
+        return await asyncio.to_thread(lambda: [self._first_missing(cell, today) for cell in cells])
+
+    async def features_many(self, cells, start, today, hourlies):
+        """Weather features for responses covering start..today, past days read from the store
+
+        The complete past days in the responses are rolled up and stored first; today's
+        24 hours are the forecast part and are never stored.
+        """
+        return await asyncio.to_thread(self._features_many, cells, start, today, hourlies)
+
+    def _features_many(self, cells, start, today, hourlies):
+        temp = hourly_matrix(hourlies, "temperature_2m")
+        precip = hourly_matrix(hourlies, "precipitation")
+        hum = hourly_matrix(hourlies, "relative_humidity_2m")
+        prob = hourly_matrix(hourlies, "precipitation_probability")
+
+        n_days = (today - start).days
+        sums = np.stack([temp[:, :24 * n_days], precip[:, :24 * n_days], hum[:, :24 * n_days]])
+        daily = sums.reshape(3, len(cells), n_days, 24).sum(axis=3)  # (variable, cell, day)
+        first_day = today.toordinal() - PAST_DAYS
+
+        envs = []
+        with self._lock:
+            for i, cell in enumerate(cells):
+                rows = self._open(cell, create=True)
+                # No flush(): the kernel writes the mapping back, an msync per cell only added latency
+                for d in range(n_days):
+                    day = start.toordinal() + d
+                    rows[day % RING_DAYS] = (day, daily[0, i, d], daily[1, i, d], daily[2, i, d])
+                window = rows[np.isin(rows[:, DAY], np.arange(first_day, today.toordinal()))]
+                if len(window) != PAST_DAYS:
+                    raise ValueError(f"Weather store for {cell} is missing days before {today}")
+
+                envs.append({
+                    "past_temp": float(window[:, TEMP].sum() / PAST_HOURS),
+                    "future_temp": float(np.mean(temp[i, -24:])),
+                    "past_rain": float(window[:, PRECIP].sum()),
+                    "hum": float((window[:, HUM].sum() + hum[i, -24:].sum()) / (PAST_HOURS + 24)),
+                    "future_prob": float(np.max(prob[i, -24:]) / 100.0),  # Max prob next 24h
+                })
+            self.days_fetched += n_days * len(cells)
+            self.days_reused += (PAST_DAYS - n_days) * len(cells)
+        return envs